@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 import json
-from functools import reduce
+import re
 from collections import namedtuple
 
 
@@ -16,27 +16,185 @@ cell_formatters = {
 
 legal_file_extensions = ("md", "py")
 Cell = namedtuple("Cell", ["descriptor", "source"])
+# the keys of a notebook cell that are read, and their fields
+cell_keys = {"cell_type": "descriptor", "source": "source"}
+
+
+class JSONStream:
+    """Reads JSON from a file chunk by chunk. Values are either decoded or
+    skipped, skipped ones are never held in memory as a whole.
+    """
+    __slots__ = ("_file", "_buffer", "_pos", "_eof", "_chunk_size")
+    _decoder = json.JSONDecoder()
+    _whitespace_re = re.compile(r"[ \t\n\r]*")
+    _scalar_re = re.compile(r"[^,\]}\s]*")
+    # everything up to the next string or bracket
+    _plain_re = re.compile(r'[^"\[\]{}]*')
+
+    def __init__(self, file, chunk_size=1 << 20):
+        self._file = file
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        self._chunk_size = chunk_size
+
+    def _fill(self, size=None):
+        """Drop what was read and read on, False at the end of the file."""
+        if self._eof:
+            return False
+        more = self._file.read(size or self._chunk_size)
+        self._eof = not more
+        self._buffer = self._buffer[self._pos:] + more
+        self._pos = 0
+        return not self._eof
+
+    def _error(self, message):
+        return json.JSONDecodeError(message, self._buffer, self._pos)
+
+    def peek(self):
+        """The next character that isn't whitespace, "" at the end."""
+        while True:
+            self._pos = self._whitespace_re.match(
+                self._buffer, self._pos
+            ).end()
+            if self._pos < len(self._buffer) or not self._fill():
+                return self._buffer[self._pos:self._pos + 1]
+
+    def expect(self, chars):
+        """Consume the next character, which has to be one of `chars`."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise self._error(f"Expecting one of {chars!r}")
+        self._pos += 1
+        return char
+
+    def read(self):
+        """Decode the value at the position."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                end = None
+            # a value that reaches the end of the buffer might be cut off,
+            # e.g. a number, so only trust it if something follows
+            if end is None or (end == len(self._buffer) and not self._eof):
+                self._fill(max(
+                    self._chunk_size, len(self._buffer) - self._pos
+                ))
+                continue
+            self._pos = end
+            return value
+
+    def _skip_string(self):
+        # a plain find for the closing quote is several times faster than
+        # a regex over the string, e.g. a base64 encoded image
+        while True:
+            buffer = self._buffer
+            end = buffer.find('"', self._pos)
+            if end == -1:
+                end = len(buffer)
+            # backslashes before it, an odd number escapes it
+            start = end
+            while start > self._pos and buffer[start - 1] == "\\":
+                start -= 1
+            if end == len(buffer):
+                # the backslashes are kept, they escape what follows
+                self._pos = start
+                if not self._fill():
+                    raise self._error("Unterminated string")
+                continue
+            self._pos = end + 1
+            if (end - start) % 2 == 0:
+                return
+
+    def skip(self):
+        """Move past the value at the position without decoding it."""
+        char = self.peek()
+        if char not in ('"', "[", "{"):
+            while True:
+                self._pos = self._scalar_re.match(
+                    self._buffer, self._pos
+                ).end()
+                if self._pos < len(self._buffer) or not self._fill():
+                    return
+        depth = 0
+        while True:
+            self._pos = self._plain_re.match(self._buffer, self._pos).end()
+            if self._pos == len(self._buffer):
+                if not self._fill():
+                    raise self._error("Unterminated value")
+                continue
+            char = self._buffer[self._pos]
+            self._pos += 1
+            if char == '"':
+                self._skip_string()
+            elif char in "[{":
+                depth += 1
+            else:
+                depth -= 1
+            if depth == 0:
+                return
+
+    def items(self):
+        """Yield the keys of the object at the position, each value has to
+        be read or skipped before the next key.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.read()
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+    def values(self):
+        """Yield once per value of the array at the position, each has to
+        be read or skipped before the next.
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield
+            if self.expect(",]") == "]":
+                return
+
+
+def iter_cells(file):
+    """Yield the cells of the notebook `file` one by one. Only their type
+    and source are decoded, outputs like base64 encoded images are skipped.
+    """
+    stream = JSONStream(file)
+    for key in stream.items():
+        if key != "cells":
+            stream.skip()
+            continue
+        for _ in stream.values():
+            cell = {}
+            for cell_key in stream.items():
+                if cell_key in cell_keys:
+                    cell[cell_keys[cell_key]] = stream.read()
+                else:
+                    stream.skip()
+            yield Cell(**cell)
+        # the rest is metadata
+        return
 
 
 def main(in_file, out_file, out_format):
-    data = map(
-        lambda obj: Cell(obj["cell_type"], obj["source"]),
-        json.load(in_file)["cells"]
-    )
-    out_string = reduce(
-        lambda acc, cell:
-        acc + (
-            cell_formatters[cell.descriptor].get(
-                out_format,
-                lambda s: ""
-            )(cell.source)
-            if not cell.source == []
-            else ""
-        ),
-        data,
-        "",
-    )
-    out_file.write(out_string)
+    for cell in iter_cells(in_file):
+        if cell.source == []:
+            continue
+        formatter = cell_formatters[cell.descriptor].get(out_format)
+        if formatter is not None:
+            out_file.write(formatter(cell.source))
 
 
 if __name__ == "__main__":
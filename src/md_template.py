@@ -1,37 +1,79 @@
 import json
+import pickle
+import mmap
+import sys
 import re
 import math
-from dateutil import parser as datetime_parser
+import functools
+from datetime import datetime, timezone
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict, deque
+import bisect
+import itertools
 import multiprocessing as mp
+import os
+import threading
+import queue
+import stat
+import time
+import types
 import logging
 
 __all__ = (
     "MissingKeyError",
     "DataContainer",
     "JSON_DataContainer",
+    "LazyJSON_DataContainer",
+    "FilterCache",
+    "RenderStats",
+    "Pipeline",
     "Filter",
-    "fill_template"
+    "Table",
+    "Executor",
+    "Template",
+    "RenderCache",
+    "fill_template",
+    "stream_template",
+    "fill_templates",
+    "Watcher",
+    "RenderServer",
+    "fill_batch"
 )
 
 # == Logging
-logging.basicConfig(level=logging.INFO)
+# Importing configures nothing, so importing the module and starting a
+# worker stay cheap. The CLI calls `setup_logging` and process workers
+# repeat the setup of their parent.
 logger = mp.get_logger()
 
 log_file_format = '[%(asctime)s %(processName)s, %(levelname)s] %(message)s'
-log_file_formater = logging.Formatter(log_file_format)
-log_file_handler = logging.FileHandler('md_template.log')
-log_file_handler.setFormatter(log_file_formater)
-log_file_handler.setLevel(logging.DEBUG)
-
 log_console_format = '%(message)s'
-log_console_formater = logging.Formatter(log_console_format)
-log_console_handler = logging.StreamHandler()
-log_console_handler.setFormatter(log_console_formater)
-log_console_handler.setLevel(logging.WARNING)
-
-logger.addHandler(log_console_handler)
-logger.addHandler(log_file_handler)
+_log_handlers = []
+_log_setup = None
+
+
+def setup_logging(log_file=None):
+    """Log warnings to stderr and, if given, everything to `log_file`."""
+    global _log_setup
+    for handler in _log_handlers:
+        logger.removeHandler(handler)
+        handler.close()
+    _log_handlers.clear()
+
+    log_console_handler = logging.StreamHandler()
+    log_console_handler.setFormatter(logging.Formatter(log_console_format))
+    log_console_handler.setLevel(logging.WARNING)
+    _log_handlers.append(log_console_handler)
+    if log_file is not None:
+        log_file_handler = logging.FileHandler(log_file)
+        log_file_handler.setFormatter(logging.Formatter(log_file_format))
+        log_file_handler.setLevel(logging.DEBUG)
+        _log_handlers.append(log_file_handler)
+
+    for handler in _log_handlers:
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    _log_setup = {"log_file": log_file}
 
 
 # == Exceptions
@@ -61,31 +103,584 @@ class DataContainer(metaclass=ABCMeta):
 
 
 class JSON_DataContainer(DataContainer, file_type="json"):
-    def __init__(self, file):
+    __slots__ = ('_resolved')
+    # key -> ((prefix, link, index), ...) shared by all containers
+    _key_paths = {}
+    # ASCII digits only, `str.isdigit` also takes e.g. "²"
+    _index_re = re.compile(r"-?[0-9]+")
+
+    def __init__(self, file, key_paths=None):
         if isinstance(file, str):
             with open(file, "r") as f:
                 self._data = json.load(f)
         else:
             self._data = json.load(file)
+        self._resolved = {}
+
+    @classmethod
+    def from_object(cls, obj):
+        container = cls.__new__(cls)
+        container._data = obj
+        container._resolved = {}
+        return container
+
+    @staticmethod
+    def iter_records(file, chunk_size=1 << 16):
+        """Yield the values of a JSON array or of a NDJSON stream one by one
+        without reading the whole file.
+        """
+        decoder = json.JSONDecoder()
+        whitespace = re.compile(r"[ \t\n\r]*")
+        # what could still belong to a number up to the end of the buffer
+        number_tail = re.compile(r"[0-9.eE+\-]*\Z")
+        buffer = ""
+        eof = False
+        pos = 0
+        while pos == len(buffer) and not eof:
+            more = file.read(chunk_size)
+            eof = len(more) < chunk_size
+            buffer = buffer[pos:] + more
+            pos = whitespace.match(buffer).end()
+        in_array = buffer[pos:pos + 1] == "["
+        if in_array:
+            pos += 1
+        while True:
+            pos = whitespace.match(buffer, pos).end()
+            if pos == len(buffer) and not eof:
+                buffer = file.read(chunk_size)
+                eof = len(buffer) < chunk_size
+                pos = 0
+                continue
+            if in_array and buffer[pos:pos + 1] == ",":
+                pos += 1
+                continue
+            if pos == len(buffer) or (in_array and buffer[pos] == "]"):
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise e
+                end = None
+            # a value that reaches the end of the buffer might be cut off,
+            # e.g. a number, so only trust it if something follows. A
+            # number can also be cut off right after its "." or "e"
+            if end is None or not eof and (
+                end == len(buffer) or
+                isinstance(record, (int, float)) and
+                number_tail.match(buffer, end)
+            ):
+                size = max(chunk_size, len(buffer) - pos)
+                more = file.read(size)
+                eof = len(more) < size
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+            yield record
+            pos = end
+
+    @classmethod
+    def _compile_key_path(cls, key):
+        key_path = []
+        prefix = None
+        for link in key.split('.'):
+            prefix = link if prefix is None else f"{prefix}.{link}"
+            index = int(link) if cls._index_re.fullmatch(link) else None
+            key_path.append((prefix, link, index))
+        key_path = cls._key_paths[key] = tuple(key_path)
+        return key_path
 
     def get_value(self, key, default=None):
         assert isinstance(key, str), "Key musst be of type str..."
-        key_chain = key.split('.')
+        # every resolved prefix is kept for the lifetime of the data, so
+        # paths sharing a prefix only walk the part that differs
+        try:
+            return self._resolved[key]
+        except KeyError:
+            pass
+        key_path = self._key_paths.get(key) or self._compile_key_path(key)
+
         current = self._data
-        for key_chain_link in key_chain:
+        start = 0
+        for i in range(len(key_path) - 2, -1, -1):
+            if key_path[i][0] in self._resolved:
+                current = self._resolved[key_path[i][0]]
+                start = i + 1
+                break
+
+        for prefix, link, index in key_path[start:]:
             try:
-                current = current[key_chain_link]
-            except KeyError as e:
-                missing_part = str(e)[1:-1]
-                raise MissingKeyError(
-                    f"'{key.split(missing_part)[0]}{missing_part}'"
-                )
+                if index is not None and isinstance(current, list):
+                    current = current[index]
+                else:
+                    current = current[link]
+            except (KeyError, IndexError, TypeError):
+                raise MissingKeyError(f"'{prefix}'")
+            self._resolved[prefix] = current
         return current
 
 
+class LazyJSON_DataContainer(JSON_DataContainer, file_type="lazy_json"):
+    """JSON container that only materializes the given key paths.
+
+    The file is memory mapped and scanned with byte regexes, values outside
+    of the requested paths are skipped without building Python objects.
+    Lists on the way to a requested path end after the last requested item,
+    unrequested items before it are None. Lists requested with a negative
+    index are read in full and the item is parsed once they are counted.
+    """
+    __slots__ = ()
+    _whitespace_re = re.compile(rb"[ \t\n\r]*")
+    _string_re = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+    _scalar_re = re.compile(rb"[^,\]}\s]*")
+    # everything up to the next bracket outside of a string
+    _plain_re = re.compile(
+        rb'[^"\[\]{}]*(?:' + _string_re.pattern + rb'[^"\[\]{}]*)*'
+    )
+
+    def __init__(self, file, key_paths=None):
+        if key_paths is None:
+            super().__init__(file, key_paths)
+            return
+
+        wanted = {}
+        for key in key_paths:
+            node = wanted
+            *links, last_link = key.split('.')
+            for link in links:
+                node = node.setdefault(link, {})
+                if node is None:
+                    break
+            else:
+                node[last_link] = None
+
+        if isinstance(file, str):
+            with open(file, "rb") as f:
+                self._data = self._load(f, wanted)
+        else:
+            self._data = self._load(file, wanted)
+        self._resolved = {}
+
+    @classmethod
+    def _load(cls, file, wanted):
+        try:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            # no real (or an empty) file, e.g. a StringIO
+            buffer = file.read()
+            if isinstance(buffer, str):
+                buffer = buffer.encode()
+        try:
+            pos = cls._whitespace_re.match(buffer).end()
+            return cls._parse(buffer, pos, wanted)[0]
+        finally:
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+
+    @classmethod
+    def _skip(cls, buffer, pos, depth=0):
+        """Return the position after the value at `pos`, or after the end of
+        the enclosing container if `depth` is 1.
+        """
+        if depth == 0:
+            char = buffer[pos:pos + 1]
+            if char == b'"':
+                return cls._string_re.match(buffer, pos).end()
+            elif char not in (b"{", b"["):
+                return cls._scalar_re.match(buffer, pos).end()
+            pos += 1
+            depth = 1
+        while True:
+            pos = cls._plain_re.match(buffer, pos).end()
+            char = buffer[pos:pos + 1]
+            if char in (b"{", b"["):
+                depth += 1
+            elif char in (b"}", b"]"):
+                depth -= 1
+            else:
+                raise json.JSONDecodeError(
+                    "Unterminated value", buffer[:pos].decode(), pos
+                )
+            pos += 1
+            if depth == 0:
+                return pos
+
+    @classmethod
+    def _parse(cls, buffer, pos, wanted):
+        """Parse the value at `pos` restricted to `wanted`, None meaning the
+        whole value, and return it with the position after it.
+        """
+        char = buffer[pos:pos + 1]
+        if wanted is None or char not in (b"{", b"["):
+            end = cls._skip(buffer, pos)
+            return json.loads(buffer[pos:end]), end
+
+        is_object = char == b"{"
+        value = {} if is_object else []
+        index = 0
+        found = 0
+        # the items of negative indices are only known at the end of the
+        # list, the positions of all items are kept until then
+        negative = not is_object and [
+            key for key in wanted
+            if key[:1] == "-" and cls._index_re.fullmatch(key)
+        ]
+        starts = []
+        pos += 1
+        while True:
+            pos = cls._whitespace_re.match(buffer, pos).end()
+            char = buffer[pos:pos + 1]
+            if char in (b"}", b"]"):
+                for key in negative or ():
+                    index = len(value) + int(key)
+                    if index < 0:
+                        continue
+                    item_wanted = wanted[key]
+                    if str(index) in wanted:
+                        item_wanted = cls._merge_wanted(
+                            wanted[str(index)], item_wanted
+                        )
+                    value[index] = cls._parse(
+                        buffer, starts[index], item_wanted
+                    )[0]
+                return value, pos + 1
+            elif char == b",":
+                pos += 1
+                continue
+            if is_object:
+                end = cls._string_re.match(buffer, pos).end()
+                key = json.loads(buffer[pos:end])
+                pos = cls._whitespace_re.match(buffer, end).end() + 1
+                pos = cls._whitespace_re.match(buffer, pos).end()
+            else:
+                key = str(index)
+                index += 1
+                if negative:
+                    starts.append(pos)
+            if key in wanted:
+                item, pos = cls._parse(buffer, pos, wanted[key])
+                found += 1
+            else:
+                item, pos = None, cls._skip(buffer, pos)
+            if is_object:
+                if key in wanted:
+                    value[key] = item
+            else:
+                value.append(item)
+            if found == len(wanted):
+                # nothing else needed from this container, negative list
+                # indices are never found so those lists are read in full
+                return value, cls._skip(buffer, pos, depth=1)
+
+    @classmethod
+    def _merge_wanted(cls, first, second):
+        # the paths wanted from an item requested by two indices
+        if first is None or second is None:
+            return None
+        merged = dict(first)
+        for key, item_wanted in second.items():
+            merged[key] = (
+                cls._merge_wanted(merged[key], item_wanted)
+                if key in merged else
+                item_wanted
+            )
+        return merged
+
+
+class FilterCache:
+    """LRU cache for filter results bounded by an estimated memory budget.
+
+    Hashable values are keyed by type and value. Unhashable values, e.g.
+    the lists and dicts of the data, are keyed by identity and the entry
+    keeps a reference to them, so their id can't be reused while cached.
+    An entry counts the size of its result and of the value it keeps.
+    The workers of a `ThreadExecutor` share it, a lock keeps their
+    lookups and evictions from interleaving.
+    """
+    __slots__ = ('max_bytes', 'hits', 'misses', '_entries', '_size', '_lock')
+    _missing = object()
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return (
+            f"<FilterCache {len(self)} entries, {self._size} bytes, "
+            f"{self.hits} hits, {self.misses} misses>"
+        )
+
+    @staticmethod
+    def _sizeof(obj):
+        # containers with their items, one level deep, a shallow size only
+        # counts the pointers to them
+        size = sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            for key, item in obj.items():
+                size += sys.getsizeof(key) + sys.getsizeof(item)
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            for item in obj:
+                size += sys.getsizeof(item)
+        return size
+
+    @staticmethod
+    def _key(value, filter_string):
+        key = (filter_string, type(value), value)
+        try:
+            hash(key)
+        except TypeError:
+            return (filter_string, id(value)), value
+        return key, None
+
+    def get(self, value, filter_string):
+        key, _ = self._key(value, filter_string)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return self._missing
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry[1]
+
+    def put(self, value, filter_string, result):
+        key, ref = self._key(value, filter_string)
+        size = self._sizeof(result)
+        if ref is not None:
+            size += self._sizeof(ref)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._size -= old_entry[2]
+            self._entries[key] = (ref, result, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class RenderStats:
+    """Where the time of a render goes, collected while `current` is set.
+
+    Process workers collect into their own instance and send it to the
+    parent with their last message, where it is merged. With `current`
+    unset the only cost is checking it once per pipeline and tag.
+    """
+    __slots__ = (
+        'filters', 'tags', 'lookups', 'workers', 'cache', 'send_to_parent'
+    )
+    current = None
+
+    def __init__(self, send_to_parent=False):
+        # filter name -> [calls, seconds], seconds include nested filters
+        self.filters = {}
+        # match -> seconds
+        self.tags = {}
+        # [count, seconds]
+        self.lookups = [0, 0.0]
+        # worker name -> [work loads, busy seconds, waiting seconds]
+        self.workers = {}
+        # [hits, misses]
+        self.cache = [0, 0]
+        self.send_to_parent = send_to_parent
+
+    def add_filter(self, name, seconds):
+        entry = self.filters.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def add_tag(self, match, seconds):
+        self.tags[match] = self.tags.get(match, 0.0) + seconds
+
+    def add_lookup(self, seconds):
+        self.lookups[0] += 1
+        self.lookups[1] += seconds
+
+    def add_worker(self, work_loads, busy, waiting):
+        thread = threading.current_thread()
+        name = (
+            mp.current_process().name
+            if thread is threading.main_thread() else
+            thread.name
+        )
+        entry = self.workers.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += work_loads
+        entry[1] += busy
+        entry[2] += waiting
+
+    def add_cache(self, cache):
+        self.cache[0] += cache.hits
+        self.cache[1] += cache.misses
+
+    def merge(self, other):
+        for name, (calls, seconds) in other.filters.items():
+            entry = self.filters.setdefault(name, [0, 0.0])
+            entry[0] += calls
+            entry[1] += seconds
+        for match, seconds in other.tags.items():
+            self.tags[match] = self.tags.get(match, 0.0) + seconds
+        self.lookups[0] += other.lookups[0]
+        self.lookups[1] += other.lookups[1]
+        for name, values in other.workers.items():
+            entry = self.workers.setdefault(name, [0, 0.0, 0.0])
+            for i, value in enumerate(values):
+                entry[i] += value
+        self.cache[0] += other.cache[0]
+        self.cache[1] += other.cache[1]
+
+    def as_dict(self):
+        lookups = self.cache[0] + self.cache[1]
+        return {
+            "filters": {
+                name: {"calls": calls, "seconds": seconds}
+                for name, (calls, seconds) in self.filters.items()
+            },
+            "tags": self.tags,
+            "key_lookups": {
+                "count": self.lookups[0], "seconds": self.lookups[1]
+            },
+            "filter_cache": {
+                "hits": self.cache[0],
+                "misses": self.cache[1],
+                "hit_rate": self.cache[0] / lookups if lookups else 0.0,
+            },
+            "workers": {
+                name: {
+                    "work_loads": work_loads,
+                    "busy_seconds": busy,
+                    "waiting_seconds": waiting
+                }
+                for name, (work_loads, busy, waiting) in self.workers.items()
+            },
+        }
+
+    def report(self, top=10):
+        stats = self.as_dict()
+        lines = [
+            f"{'filter':<24} {'calls':>10} {'total s':>10} {'mean us':>10}"
+        ]
+        for name, entry in sorted(
+            stats["filters"].items(), key=lambda item: -item[1]["seconds"]
+        ):
+            lines.append(
+                f"{name:<24} {entry['calls']:>10} {entry['seconds']:>10.4f} "
+                f"{entry['seconds'] / entry['calls'] * 1e6:>10.1f}"
+            )
+        lines.append(f"slowest of {len(self.tags)} tags:")
+        for match, seconds in sorted(
+            self.tags.items(), key=lambda item: -item[1]
+        )[:top]:
+            lines.append(f"  {seconds:>10.4f}s {match}")
+        lines.append(
+            f"key lookups: {self.lookups[0]} in {self.lookups[1]:.4f}s"
+        )
+        cache = stats["filter_cache"]
+        lines.append(
+            f"filter cache: {cache['hits']} hits, {cache['misses']} misses "
+            f"({cache['hit_rate']:.1%})"
+        )
+        if self.workers:
+            lines.append(
+                f"{'worker':<24} {'loads':>10} {'busy s':>10} {'wait s':>10}"
+            )
+            for name, (work_loads, busy, waiting) in self.workers.items():
+                lines.append(
+                    f"{name:<24} {work_loads:>10} {busy:>10.4f} "
+                    f"{waiting:>10.4f}"
+                )
+        return "\n".join(lines)
+
+
+class Pipeline:
+    """A compiled `a|b(x)|c` filter chain.
+
+    Every stage holds the filter function with its already converted
+    arguments, so applying a pipeline doesn't parse anything.
+    """
+    __slots__ = ('stages')
+
+    def __init__(self, stages):
+        # (name, filter_string, func, args, cached) per stage
+        self.stages = stages
+
+    def __repr__(self):
+        return f"<Pipeline {'|'.join(stage[1] for stage in self.stages)}>"
+
+    def __call__(self, value):
+        if RenderStats.current is not None:
+            return self._timed_call(value, RenderStats.current)
+        cache = Filter.cache
+        for name, filter_string, func, args, cached in self.stages:
+            try:
+                if cached:
+                    res = cache.get(value, filter_string)
+                    if res is FilterCache._missing:
+                        res = func(value, *args)
+                        cache.put(value, filter_string, res)
+                    value = res
+                else:
+                    value = func(value, *args)
+            except (LookupError, AttributeError):
+                raise SyntaxError(f"failing filter \"{name}\"")
+        return value
+
+    def _timed_call(self, value, stats):
+        cache = Filter.cache
+        for name, filter_string, func, args, cached in self.stages:
+            start = time.perf_counter()
+            try:
+                if cached:
+                    res = cache.get(value, filter_string)
+                    if res is FilterCache._missing:
+                        res = func(value, *args)
+                        cache.put(value, filter_string, res)
+                    value = res
+                else:
+                    value = func(value, *args)
+            except (LookupError, AttributeError):
+                raise SyntaxError(f"failing filter \"{name}\"")
+            finally:
+                stats.add_filter(name, time.perf_counter() - start)
+        return value
+
+    def render(self, value):
+        return str(self(value))
+
+
 class Filter:
     _filters = {}
-    _cache = {}
+    _uncached = set()
+    _signatures = {}
+    _arg_compilers = {}
+    _pipelines = {}
+    _registry_version = None
+    cache = FilterCache()
     _filter_re = re.compile(r"^(?P<func>[^()]+)(?:\((?P<args>.*)\))?$")
     _arg_re = re.compile(r"(?P<arg>[^(),]+(?:\([^()]*\))?)")
     escape_sequences = {
@@ -94,28 +689,74 @@ class Filter:
 
     @classmethod
     def apply_filters(cls, value, filters):
-        if filters:
-            for filter_string in filters:
-                    value = cls._apply_filter(value, filter_string)
-        return str(value)
+        return cls.compile(filters or ()).render(value)
 
     @classmethod
-    def _apply_filter(cls, value, filter_string):
-        cache_key = str(value) + "___" + filter_string
-        if cache_key in cls._cache:
-            return cls._cache[cache_key]
-        elif filter_string != "":
-            try:
-                func, args = cls._parse_filter(filter_string)
-                value = cls._filters[func](value, *args)
-                cls._cache[cache_key] = value
-                return value
-            except KeyError as e:
-                raise SyntaxError(f"unkown filter \"{func}\"")
-            except AttributeError as e:
-                raise SyntaxError("illegal filter syntax")
-        else:
+    def compile(cls, filter_strings):
+        """Compile a sequence of filter strings into a `Pipeline`.
+
+        Raises SyntaxError for unknown filters, malformed filter strings
+        and wrong numbers of arguments. Pipelines are cached per process.
+        """
+        filter_strings = tuple(filter_strings)
+        pipeline = cls._pipelines.get(filter_strings)
+        if pipeline is None:
+            pipeline = cls._pipelines[filter_strings] = Pipeline(tuple(
+                cls._compile_stage(filter_string)
+                for filter_string in filter_strings
+            ))
+        return pipeline
+
+    @classmethod
+    def _compile_stage(cls, filter_string):
+        try:
+            name, args = cls._parse_filter(filter_string)
+        except AttributeError:
             raise SyntaxError("illegal filter syntax")
+        if name not in cls._filters:
+            raise SyntaxError(f"unkown filter \"{name}\"")
+        signature = cls._signatures.get(name)
+        if signature is None:
+            # inspect is slow to import and only needed once per filter
+            import inspect
+            signature = cls._signatures[name] = inspect.signature(
+                cls._filters[name]
+            )
+        try:
+            if name in cls._arg_compilers:
+                args = cls._arg_compilers[name](*args)
+            signature.bind(None, *args)
+        except TypeError:
+            raise SyntaxError(f"wrong arguments for filter \"{name}\"")
+        return (
+            name,
+            filter_string,
+            cls._filters[name],
+            tuple(args),
+            name not in cls._uncached
+        )
+
+    @classmethod
+    def registry_version(cls):
+        """A digest of all registered filters and their code."""
+        if cls._registry_version is None:
+            import hashlib
+            digest = hashlib.sha256()
+
+            def update(code):
+                digest.update(code.co_code)
+                for const in code.co_consts:
+                    if isinstance(const, types.CodeType):
+                        update(const)
+                    else:
+                        digest.update(repr(const).encode())
+
+            for name in sorted(cls._filters):
+                digest.update(name.encode())
+                digest.update(str(name in cls._uncached).encode())
+                update(cls._filters[name].__code__)
+            cls._registry_version = digest.hexdigest()
+        return cls._registry_version
 
     @classmethod
     def _parse_filter(cls, filter_string):
@@ -130,18 +771,32 @@ class Filter:
         return func, args
 
     @classmethod
-    def register(cls, func):
-        cls._filters[func.__qualname__] = func
-        return func
+    def register(cls, func=None, *, cache=True, compile_args=None):
+        """Register `func` as filter under its qualified name.
+
+        Use `@Filter.register(cache=False)` for filters that are cheaper
+        than a cache lookup or that aren't deterministic. `compile_args`
+        converts the raw string arguments once when a pipeline is compiled.
+        """
+        def decorator(func):
+            cls._registry_version = None
+            cls._filters[func.__qualname__] = func
+            cls._signatures.pop(func.__qualname__, None)
+            if not cache:
+                cls._uncached.add(func.__qualname__)
+            if compile_args is not None:
+                cls._arg_compilers[func.__qualname__] = compile_args
+            return func
+        return decorator if func is None else decorator(func)
 
 
 # == Filters
 class Link:
-    @Filter.register
+    @Filter.register(cache=False)
     def as_name(val, target):
         return f"[{val}]({target})"
 
-    @Filter.register
+    @Filter.register(cache=False)
     def as_target(val, name):
         return f"[{name}]({val})"
 
@@ -154,7 +809,7 @@ def get_mul(val, target):
     ]
 
 
-@Filter.register
+@Filter.register(cache=False)
 def get(val, target):
     return val[target if isinstance(val, dict) else int(target)]
 
@@ -169,67 +824,148 @@ def ol(vals):
     return "\n".join(f"{i+1}. {val}" for i, val in enumerate(vals))
 
 
-@Filter.register
+@Filter.register(cache=False)
 def bold(val):
     return f"__{val}__"
 
 
-@Filter.register
+@Filter.register(cache=False)
 def italic(val):
     return f"*{val}*"
 
 
-@Filter.register
+@Filter.register(cache=False)
 def strikethrough(val):
     return f"~~{val}~~"
 
 
-@Filter.register
+@Filter.register(cache=False)
 def heading(val, level=1):
     return ("#" * int(level)) + f" {val}"
 
 
+class Table:
+    """A markdown table stored column by column.
+
+    Rows are read in a single pass that collects the headings in the order
+    they first appear, formats the cells and tracks the column widths. The
+    table is rendered line by line and joined once by `str`.
+    """
+    __slots__ = ('headings', 'columns', 'widths', 'length')
+
+    def __init__(self, rows, headings=(), index=None):
+        # index: optional first column, e.g. the keys of a dict of rows
+        fixed_headings = bool(headings)
+        self.headings = list(headings)
+        self.columns = [[] for _ in self.headings]
+        positions = {heading: i for i, heading in enumerate(self.headings)}
+        if index is not None:
+            positions = {heading: i + 1 for heading, i in positions.items()}
+            self.headings.insert(0, "_")
+            self.columns.insert(
+                0, [str(key).strip().replace("\n", " ") for key in index]
+            )
+
+        headings = self.headings
+        columns = self.columns
+        length = 0
+        for row in rows:
+            filled = 0
+            for heading, value in row.items():
+                position = positions.get(heading)
+                if position is None:
+                    if fixed_headings or heading == "_" and index is not None:
+                        continue
+                    position = positions[heading] = len(headings)
+                    headings.append(heading)
+                    columns.append(["-"] * length)
+                columns[position].append(
+                    str(value).strip().replace("\n", " ")
+                )
+                filled += 1
+            length += 1
+            if filled < len(columns):
+                for column in columns:
+                    if len(column) < length:
+                        column.append("-")
+        self.length = length
+
+        self.widths = [
+            max(len(str(heading)), 1, *map(len, column))
+            for heading, column in zip(self.headings, self.columns)
+        ]
+
+    def __iter__(self):
+        if not self.headings:
+            return
+        row = "| " + " | ".join(
+            f"{{:<{width}}}" for width in self.widths
+        ) + " |\n"
+        yield row.format(*map(str, self.headings))
+        yield "|" + "|".join("-" * (width + 2) for width in self.widths) + "|\n"
+        for cells in zip(*self.columns):
+            yield row.format(*cells)
+
+    def __str__(self):
+        return "".join(self)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sum(
+            sys.getsizeof(cell) for column in self.columns for cell in column
+        )
+
+
 @Filter.register
 def tabularize(vals, *headings):
     if len(vals) == 0:
         return ""
+    if isinstance(vals, dict) and isinstance(next(iter(vals.values())), dict):
+        index = sorted(vals)
+        return Table((vals[key] for key in index), headings, index=index)
+    return Table(vals, headings)
+
+
+# unambiguous formats dateutil reads the same way, tried after ISO 8601
+_date_formats = (
+    "%Y/%m/%d",
+    "%Y/%m/%d %H:%M",
+    "%Y/%m/%d %H:%M:%S",
+    "%d %B %Y",
+    "%d %b %Y",
+    "%B %d, %Y",
+    "%b %d, %Y",
+)
 
-    def row(coll, fill=" "):
-        return "|" + "|".join(fill + str(val) + fill for val in coll) + "|\n"
-
-    def generate_headings(v):
-        return set(key for item in v for key in item)
 
-    if isinstance(vals, dict) and isinstance(list(vals.values())[0], dict):
-        vals = sorted(
-            [dict(_=key, **vals[key]) for key in vals],
-            key=lambda x: x["_"]
-        )
-        headings = (
-            ["_"] +
-            list(
-                headings or
-                (generate_headings(vals) - set(["_"]))
-            )
-        )
-    elif len(headings) == 0:
-        headings = generate_headings(vals)
-    table = (
-        row(headings) +
-        row(("-" * len(heading) for heading in headings), fill="-")
-    )
-    for entry in vals:
-        new_row = row(
-            str(entry[heading]).strip().replace("\n", " ") if heading in entry else "-"
-            for heading in headings
-        )
-        table += new_row
-    return table
+@functools.lru_cache(maxsize=1 << 14)
+def _parse_date(val):
+    """Parse `val` like `dateutil.parser.parse`, which is only imported and
+    used for strings that aren't ISO 8601 or in `_date_formats`.
+    """
+    parsed = None
+    if isinstance(val, str):
+        try:
+            parsed = datetime.fromisoformat(val)
+        except ValueError:
+            for date_format in _date_formats:
+                try:
+                    parsed = datetime.strptime(val, date_format)
+                    break
+                except ValueError:
+                    pass
+    if parsed is None:
+        from dateutil import parser as datetime_parser
+        return datetime_parser.parse(val)
+    offset = parsed.utcoffset()
+    if offset:
+        # dateutil leaves fixed offsets unnamed, so %Z is empty for them
+        parsed = parsed.replace(tzinfo=timezone(offset, ""))
+    return parsed
 
 
 @Filter.register
 def date(val, output_format="%x %X"):
-    return datetime_parser.parse(val).strftime(output_format)
+    return _parse_date(val).strftime(output_format)
 
 
 @Filter.register
@@ -249,45 +985,66 @@ def adjust(val, adjustment, precision=0):
         raise SyntaxError(f"unkown adjustment \"{adjustment}\"")
 
 
-@Filter.register
-def for_each(vals, *filter_strings):
+@Filter.register(
+    compile_args=lambda *filter_strings: (Filter.compile(filter_strings),)
+)
+def for_each(vals, pipeline):
     ress = []
     for val in vals:
         if len(val) > 0:
-            res = Filter.apply_filters(val, filter_strings)
+            res = pipeline.render(val)
             if len(res) > 0:
                 ress.append(res)
     return ress
 
 
-@Filter.register
-def join(vals, delim, escape=None):
+def _compile_join_args(delim, escape=None):
     if escape and delim in Filter.escape_sequences:
         delim = Filter.escape_sequences[delim]
+    return (delim,)
+
+
+@Filter.register(compile_args=_compile_join_args)
+def join(vals, delim):
     return delim.join(vals)
 
 
 # == Templating Engine
-def _compute_tag(data, match, location, verbose, force, default):
-    if verbose:
+def _print_tag(match, locations):
+    for location in locations:
         print(
             f"Found tag at {str(location): >10}:"
             f" {match[2:-2]}"
         )
-    match_parts = match[2:-2].split("|")
+
+
+def _compute_tag(data, match, locations, verbose, force, default):
+    if verbose:
+        _print_tag(match, locations)
+    key, *filter_strings = match[2:-2].split("|")
+    stats = RenderStats.current
     res = None
     try:
-        res = Filter.apply_filters(
-            data[match_parts[0]],
-            match_parts[1:] if len(match_parts) > 1 else None
-        )
+        if stats is None:
+            res = Filter.compile(filter_strings).render(data[key])
+        else:
+            start = time.perf_counter()
+            value = data[key]
+            if not isinstance(data, _ResolvedValues):
+                stats.add_lookup(time.perf_counter() - start)
+            res = Filter.compile(filter_strings).render(value)
+            stats.add_tag(match, time.perf_counter() - start)
     except SyntaxError as e:
-        logger.warning(
-            f"<!> Found {e.args[0]} at {str(location)}. "
-            f"--> \"{match[2:-2]}\""
-        )
+        for location in locations:
+            logger.warning(
+                f"<!> Found {e.args[0]} at {str(location)}. "
+                f"--> \"{match[2:-2]}\""
+            )
     except MissingKeyError as e:
-        logger.warning(f"<!> unkown key --> {e.args[0]}")
+        for location in locations:
+            logger.warning(
+                f"<!> unkown key --> {e.args[0]} at {str(location)}"
+            )
     except Exception as e:
         logger.error(e.args[0])
         raise e
@@ -298,23 +1055,774 @@ def _compute_tag(data, match, location, verbose, force, default):
     return (match, res)
 
 
-def _worker(in_q, out_q, data, verbose, force, default):
+class _ResolvedValues(dict):
+    """The values of the keys of some tags, resolved by the parent process
+    so workers don't need the whole data container.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, MissingKeyError):
+            raise value
+        return value
+
+    @classmethod
+    def resolve(cls, data, tags):
+        stats = RenderStats.current
+        values = cls()
+        for match, _ in tags:
+            key = match[2:-2].split("|")[0]
+            if key not in values:
+                start = time.perf_counter()
+                try:
+                    values[key] = data[key]
+                except MissingKeyError as e:
+                    values[key] = e
+                if stats is not None:
+                    stats.add_lookup(time.perf_counter() - start)
+        return values
+
+
+def _iter_queue(in_q, out_q):
+    """Yield the work loads of `in_q` until the `None` sentinel, then tell
+    the parent this worker is done. Records how long the worker waited for
+    and worked on each work load.
+    """
+    stats = RenderStats.current
     while True:
+        start = time.perf_counter()
         work_load = in_q.get()
+        received = time.perf_counter()
         if work_load is None:
             break
-        else:
-            match, location = work_load
-            result = _compute_tag(
+        yield work_load
+        if stats is not None:
+            stats.add_worker(
+                1, time.perf_counter() - received, received - start
+            )
+    if stats is not None and stats.send_to_parent:
+        stats.add_cache(Filter.cache)
+        out_q.put(stats)
+    else:
+        out_q.put(None)
+
+
+def _sendable_error(e):
+    # an exception that doesn't pickle would be lost on the way to the
+    # parent, which then waits for it forever
+    try:
+        pickle.loads(pickle.dumps(e))
+    except Exception:
+        return RuntimeError(f"{type(e).__name__}: {e}")
+    return e
+
+
+def _worker(in_q, out_q, verbose, force, default):
+    for data, tags in _iter_queue(in_q, out_q):
+        try:
+            out_q.put([
+                _compute_tag(
+                    data,
+                    match,
+                    locations,
+                    verbose,
+                    force,
+                    default
+                )
+                for match, locations in tags
+            ])
+        except Exception as e:
+            # the parent is waiting for this work load, fail it instead
+            out_q.put(_sendable_error(e))
+
+
+def _pool_worker(in_q, out_q):
+    # the options come with every work load, the pool outlives a render
+    for data, tags, verbose, force, default in _iter_queue(in_q, out_q):
+        try:
+            out_q.put([
+                _compute_tag(data, match, locations, verbose, force, default)
+                for match, locations in tags
+            ])
+        except Exception as e:
+            # the parent is waiting for this work load, fail it instead
+            out_q.put(_sendable_error(e))
+
+
+def _process_worker(config, target, *args):
+    # spawned processes start with a fresh module, so carry over the
+    # configuration of the parent
+    Filter.cache.max_bytes = config["cache_max_bytes"]
+    if config["log_setup"] is not None:
+        setup_logging(**config["log_setup"])
+    if config["collect_stats"]:
+        RenderStats.current = RenderStats(send_to_parent=True)
+    target(*args)
+
+
+# == Executors
+class Executor(metaclass=ABCMeta):
+    """Strategy for evaluating the tags of a template.
+
+    `compute` takes the distinct tags of a template as `(match, locations)`
+    pairs and returns a dict mapping each match to its rendered result.
+    """
+    __slots__ = ('number_of_workers', 'chunk_size')
+    _available_executors = {}
+
+    @classmethod
+    def make_executor(cls, kind, *args, **kwargs):
+        return cls._available_executors[kind](*args, **kwargs)
+
+    def __init_subclass__(cls, kind=None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if kind is not None:
+            Executor._available_executors[kind] = cls
+
+    def __init__(self, number_of_workers=1, chunk_size=None):
+        self.number_of_workers = max(1, number_of_workers)
+        self.chunk_size = chunk_size
+
+    def _chunks(self, tags):
+        # a few chunks per worker keeps them all busy without paying one
+        # queue message per tag
+        chunk_size = self.chunk_size or max(
+            1, math.ceil(len(tags) / (self.number_of_workers * 4))
+        )
+        for i in range(0, len(tags), chunk_size):
+            yield tags[i:i + chunk_size]
+
+    @abstractmethod
+    def compute(self, tags, data, verbose, force, default):
+        ...
+
+
+class SerialExecutor(Executor, kind="serial"):
+    __slots__ = ()
+
+    def compute(self, tags, data, verbose, force, default):
+        results = {}
+        for match, locations in tags:
+            _, res = _compute_tag(
+                data, match, locations, verbose, force, default
+            )
+            results.setdefault(match, res)
+        return results
+
+
+class _QueueExecutor(Executor):
+    __slots__ = ()
+    # whether workers get the resolved values of their tags instead of the
+    # data, needed when the data would be copied into every worker
+    ship_values = False
+
+    @abstractmethod
+    def _make_queue(self, maxsize=0):
+        ...
+
+    @abstractmethod
+    def _make_worker(self, target, args):
+        ...
+
+    def _check_workers(self, workers, running):
+        """Raise if fewer workers are alive than haven't said goodbye yet,
+        their work loads are lost.
+        """
+        if sum(worker.is_alive() for worker in workers) >= running:
+            return
+        for worker in workers:
+            if hasattr(worker, "terminate"):
+                worker.terminate()
+        raise RuntimeError("a worker died during the render")
+
+    def _run(self, target, args, work_loads):
+        """Feed `work_loads` to up to `number_of_workers` workers running
+        `target(in_q, out_q, *args)` and yield their results as they come
+        in. The input queue is bounded, so `work_loads` may be a lazy
+        iterable of any length. Queues are only waited on for a second at
+        a time, so a worker that died is noticed instead of waited for.
+        """
+        stats = RenderStats.current
+        workers = []
+        in_q = self._make_queue(self.number_of_workers * 4)
+        out_q = self._make_queue()
+        waiting = 0.0
+
+        for work_load in work_loads:
+            if len(workers) < self.number_of_workers:
+                worker = self._make_worker(target, (in_q, out_q, *args))
+                workers.append(worker)
+                worker.start()
+            start = time.perf_counter()
+            while True:
+                try:
+                    in_q.put(work_load, timeout=1)
+                    break
+                except queue.Full:
+                    self._check_workers(workers, len(workers))
+            waiting += time.perf_counter() - start
+            while True:
+                try:
+                    results = out_q.get_nowait()
+                except queue.Empty:
+                    break
+                yield results
+
+        for _ in workers:
+            while True:
+                try:
+                    in_q.put(None, timeout=1)
+                    break
+                except queue.Full:
+                    # none of them exited yet, each one waits for its None
+                    self._check_workers(workers, len(workers))
+
+        running = len(workers)
+        # a goodbye can still be on its way from a worker that just exited
+        suspicious = False
+        while running > 0:
+            start = time.perf_counter()
+            try:
+                results = out_q.get(timeout=1)
+            except queue.Empty:
+                if suspicious:
+                    self._check_workers(workers, running)
+                suspicious = (
+                    sum(worker.is_alive() for worker in workers) < running
+                )
+                continue
+            finally:
+                waiting += time.perf_counter() - start
+            suspicious = False
+            if results is None:
+                running -= 1
+            elif isinstance(results, RenderStats):
+                running -= 1
+                if stats is not None:
+                    stats.merge(results)
+            else:
+                yield results
+
+        for worker in workers:
+            worker.join()
+        if stats is not None:
+            stats.add_worker(0, 0.0, waiting)
+
+    def compute(self, tags, data, verbose, force, default):
+        results = {}
+        work_loads = (
+            (
+                _ResolvedValues.resolve(data, chunk)
+                if self.ship_values else
                 data,
-                match,
-                location,
+                chunk
+            )
+            for chunk in self._chunks(tags)
+        )
+        error = None
+        for chunk_results in self._run(
+            _worker,
+            (verbose, force, default),
+            work_loads
+        ):
+            if isinstance(chunk_results, Exception):
+                # the workers still finish the other work loads and exit
+                error = error or chunk_results
+                continue
+            for match, res in chunk_results:
+                results.setdefault(match, res)
+        if error is not None:
+            raise error
+        return results
+
+
+class ThreadExecutor(_QueueExecutor, kind="thread"):
+    __slots__ = ()
+
+    def _make_queue(self, maxsize=0):
+        return queue.Queue(maxsize)
+
+    def _make_worker(self, target, args):
+        return threading.Thread(target=target, args=args, daemon=True)
+
+
+class ProcessExecutor(_QueueExecutor, kind="process"):
+    __slots__ = ()
+    ship_values = True
+
+    def _make_queue(self, maxsize=0):
+        return mp.Queue(maxsize)
+
+    def _make_worker(self, target, args):
+        return mp.Process(
+            target=_process_worker,
+            args=(
+                {
+                    "cache_max_bytes": Filter.cache.max_bytes,
+                    "log_setup": _log_setup,
+                    "collect_stats": RenderStats.current is not None,
+                },
+                target,
+                *args
+            )
+        )
+
+
+class AutoExecutor(Executor, kind="auto"):
+    """Evaluates the first tags serially to estimate their cost and only
+    hands the remaining ones to worker processes if that is estimated to
+    be faster than finishing them serially.
+    """
+    __slots__ = ()
+    # measured with the spawn start method: a worker needs ~0.15s until it
+    # has imported this module and unpickled small data, and every tag
+    # adds ~5us of pickling and queue traffic in chunked messages
+    process_startup_cost = 0.15
+    process_cost_per_tag = 0.000005
+    sample_size = 64
+
+    def _prefer_processes(self, remaining, cost_per_tag):
+        cpus = os.cpu_count() or 1
+        workers = min(self.number_of_workers, cpus)
+        if workers <= 1 or remaining == 0:
+            return False
+        serial_cost = remaining * cost_per_tag
+        parallel_cost = (
+            self.process_startup_cost *
+            math.ceil(self.number_of_workers / cpus) +
+            remaining * self.process_cost_per_tag +
+            serial_cost / workers
+        )
+        return parallel_cost < serial_cost
+
+    def compute(self, tags, data, verbose, force, default):
+        serial = SerialExecutor()
+        sample = tags[:self.sample_size]
+        start = time.perf_counter()
+        results = serial.compute(sample, data, verbose, force, default)
+        cost_per_tag = (time.perf_counter() - start) / max(1, len(sample))
+
+        remaining = tags[len(sample):]
+        if self._prefer_processes(len(remaining), cost_per_tag):
+            executor = self._process_executor()
+        else:
+            executor = serial
+        for match, res in executor.compute(
+            remaining, data, verbose, force, default
+        ).items():
+            results.setdefault(match, res)
+        return results
+
+    def _process_executor(self):
+        return ProcessExecutor(self.number_of_workers, self.chunk_size)
+
+
+class _PoolExecutor(ProcessExecutor):
+    """Process executor whose workers stay alive between `compute` calls,
+    so they are only started once. `start` spawns missing workers ahead
+    of the first call, `close` stops them.
+    """
+    __slots__ = ('_in_q', '_out_q', '_workers')
+
+    def __init__(self, number_of_workers=1, chunk_size=None):
+        super().__init__(number_of_workers, chunk_size)
+        self._in_q = self._make_queue()
+        self._out_q = self._make_queue()
+        self._workers = []
+
+    def start(self):
+        self._workers = [
+            worker for worker in self._workers if worker.is_alive()
+        ]
+        while len(self._workers) < self.number_of_workers:
+            worker = self._make_worker(
+                _pool_worker, (self._in_q, self._out_q)
+            )
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def compute(self, tags, data, verbose, force, default):
+        self.start()
+        pending = 0
+        for chunk in self._chunks(tags):
+            self._in_q.put((
+                _ResolvedValues.resolve(data, chunk),
+                chunk,
                 verbose,
                 force,
                 default
+            ))
+            pending += 1
+
+        results = {}
+        error = None
+        while pending > 0:
+            try:
+                chunk_results = self._out_q.get(timeout=1)
+            except queue.Empty:
+                if all(worker.is_alive() for worker in self._workers):
+                    continue
+                # the work loads of a dead worker are lost, start over
+                self.close(terminate=True)
+                raise RuntimeError("a pool worker died during the render")
+            pending -= 1
+            if isinstance(chunk_results, Exception):
+                error = chunk_results
+                continue
+            for match, res in chunk_results:
+                results.setdefault(match, res)
+        if error is not None:
+            raise error
+        return results
+
+    def close(self, terminate=False):
+        if terminate:
+            for worker in self._workers:
+                worker.terminate()
+            self._in_q = self._make_queue()
+            self._out_q = self._make_queue()
+        else:
+            for _ in self._workers:
+                self._in_q.put(None)
+            # every worker says goodbye before it may exit
+            for _ in self._workers:
+                self._out_q.get()
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+
+class _WarmAutoExecutor(AutoExecutor):
+    """`AutoExecutor` handing its tags to an already running pool."""
+    __slots__ = ('pool',)
+    process_startup_cost = 0.0
+
+    def __init__(self, pool):
+        super().__init__(pool.number_of_workers, pool.chunk_size)
+        self.pool = pool
+
+    def _process_executor(self):
+        return self.pool
+
+
+# == Templates
+def _common_prefix_length(a, b, block_size=1 << 16):
+    length = min(len(a), len(b))
+    i = 0
+    while i < length and a[i:i + block_size] == b[i:i + block_size]:
+        i += block_size
+    while i < length and a[i] == b[i]:
+        i += 1
+    return min(i, length)
+
+
+def _common_suffix_length(a, b, limit, block_size=1 << 16):
+    i = 0
+    while i < limit and (
+        a[max(0, len(a) - i - block_size):len(a) - i] ==
+        b[max(0, len(b) - i - block_size):len(b) - i]
+    ):
+        i += block_size
+    i = min(i, limit)
+    while i < limit and a[len(a) - i - 1] == b[len(b) - i - 1]:
+        i += 1
+    return min(i, limit)
+
+
+class Template:
+    """A template split into literal and tag nodes.
+
+    The text is scanned once on construction, rendering only evaluates the
+    tags and joins the nodes, so one instance can be rendered repeatedly.
+    The filters of every tag are compiled up front, tags with filter syntax
+    errors are reported once here and never evaluated. Repeated tags are
+    evaluated once per render and filled in at all of their locations.
+    """
+    __slots__ = (
+        '_nodes', '_tags', '_tag_indices', '_invalid', '_errors', '_offset'
+    )
+    _tag_re = re.compile(r"{{[^\}]*}}")
+    # the end of a text that could be the start of a tag continuing after it
+    _partial_tag_re = re.compile(r"{(?:{[^\}]*\}?)?\Z")
+
+    def __init__(self, template_text, offset=0):
+        """`offset` is added to the locations of the tags, for templates
+        that are part of a larger text.
+        """
+        self._nodes = []
+        # match -> locations of the valid tags, in order of appearance
+        self._tags = {}
+        self._tag_indices = []
+        self._invalid = set()
+        self._errors = []
+        self._offset = offset
+        last_end = 0
+        for match in self._tag_re.finditer(template_text):
+            start, end = match.span()
+            location = (start + offset, end + offset)
+            if start > last_end:
+                self._nodes.append(template_text[last_end:start])
+            self._tag_indices.append(len(self._nodes))
+            self._nodes.append(match.group(0))
+            if match.group(0) in self._tags:
+                self._tags[match.group(0)].append(location)
+            elif self._compile_tag(match.group(0), location):
+                self._tags[match.group(0)] = [location]
+            last_end = end
+        if last_end < len(template_text):
+            self._nodes.append(template_text[last_end:])
+        self.log_errors()
+
+    def _compile_tag(self, match, location):
+        if match in self._invalid:
+            return False
+        try:
+            Filter.compile(match[2:-2].split("|")[1:])
+        except SyntaxError as e:
+            self._errors.append((e.args[0], location, match))
+            self._invalid.add(match)
+            return False
+        return True
+
+    def log_errors(self):
+        for message, location, match in self._errors:
+            logger.warning(
+                f"<!> Found {message} at {str(location)}. "
+                f"--> \"{match[2:-2]}\""
+            )
+
+    @property
+    def tags(self):
+        """The distinct valid tags as `(match, locations)` pairs."""
+        return tuple(
+            (match, tuple(locations))
+            for match, locations in self._tags.items()
+        )
+
+    def to_dict(self):
+        """The compiled state as a dict of builtin types, see `from_dict`."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, state):
+        """The template `to_dict` returned `state` for, None if `state`
+        doesn't hold one.
+        """
+        if state.keys() != set(cls.__slots__):
+            return None
+        template = cls.__new__(cls)
+        for name, value in state.items():
+            setattr(template, name, value)
+        return template
+
+    @property
+    def invalid_tags(self):
+        """The distinct invalid tags as `(match, locations)` pairs. Only
+        their first locations are kept, the others are found again.
+        """
+        if not self._invalid:
+            return ()
+        starts = list(
+            itertools.accumulate(map(len, self._nodes), initial=self._offset)
+        )
+        tags = {}
+        for index in self._tag_indices:
+            match = self._nodes[index]
+            if match in self._invalid:
+                tags.setdefault(match, []).append(
+                    (starts[index], starts[index] + len(match))
+                )
+        return tuple(
+            (match, tuple(locations)) for match, locations in tags.items()
+        )
+
+    @property
+    def key_paths(self):
+        """The data keys referenced by the tags of this template."""
+        return {match[2:-2].split("|")[0] for match in self._tags}
+
+    def recompile(self, old_text, new_text):
+        """Compile `new_text`, an edit of the `old_text` this template was
+        compiled from, by only scanning the region that changed.
+
+        The region is widened to just after a "}}" on both sides. No tag
+        can span such a position, so the nodes before and after it are
+        taken over, only shifting the locations after it.
+        """
+        prefix = _common_prefix_length(old_text, new_text)
+        suffix = _common_suffix_length(
+            old_text, new_text, min(len(old_text), len(new_text)) - prefix
+        )
+        start = new_text.rfind("}}", 0, prefix)
+        start = 0 if start == -1 else start + 2
+        end = new_text.find("}}", len(new_text) - suffix)
+        end = len(new_text) if end == -1 else end + 2
+        shift = len(new_text) - len(old_text)
+        old_end = end - shift
+
+        # split the old nodes at `start` and `old_end`
+        ends = list(itertools.accumulate(map(len, self._nodes)))
+        head_count = bisect.bisect_right(ends, start)
+        head = self._nodes[:head_count]
+        if head_count < len(self._nodes) and start > (
+            ends[head_count - 1] if head_count else 0
+        ):
+            head.append(self._nodes[head_count][:start - (
+                ends[head_count - 1] if head_count else 0
+            )])
+        tail_first = bisect.bisect_right(ends, old_end)
+        tail = self._nodes[tail_first:]
+        if tail_first < len(self._nodes) and old_end > (
+            ends[tail_first - 1] if tail_first else 0
+        ):
+            tail[0] = tail[0][old_end - (
+                ends[tail_first - 1] if tail_first else 0
+            ):]
+
+        middle = Template(new_text[start:end], start)
+        template = Template.__new__(Template)
+        template._nodes = head + middle._nodes + tail
+        template._offset = self._offset
+        # the tag indices are sorted, only the middle and tail ones move
+        head_tags = bisect.bisect_left(self._tag_indices, len(head))
+        tail_tags = bisect.bisect_left(self._tag_indices, tail_first)
+        template._tag_indices = (
+            self._tag_indices[:head_tags] +
+            list(map(len(head).__add__, middle._tag_indices)) +
+            list(map(
+                (len(head) + len(middle._nodes) - tail_first).__add__,
+                self._tag_indices[tail_tags:]
+            ))
+        )
+        template._invalid = self._invalid | middle._invalid
+
+        # errors are reported at the first location of every invalid tag
+        errors = [
+            error for error in self._errors if error[1][0] < start
+        ] + middle._errors + [
+            (message, (location[0] + shift, location[1] + shift), match)
+            for message, location, match in self._errors
+            if location[0] >= old_end
+        ]
+        lost = {
+            match: message
+            for message, location, match in self._errors
+            if start <= location[0] < old_end
+        }
+        for index in itertools.islice(self._tag_indices, tail_tags, None):
+            if not lost:
+                break
+            if self._nodes[index] in lost:
+                match = self._nodes[index]
+                location = ends[index - 1] + shift
+                errors.append(
+                    (lost.pop(match), (location, location + len(match)), match)
+                )
+        reported = set()
+        template._errors = []
+        for error in sorted(errors, key=lambda error: error[1]):
+            if error[2] not in reported:
+                reported.add(error[2])
+                template._errors.append(error)
+
+        # in order of appearance: head, middle, then tail. Lists taken over
+        # whole are shared with this template, so they are only concatenated
+        # and never extended in place
+        template._tags = {}
+        tails = []
+        for match, locations in self._tags.items():
+            if locations[-1][0] < start:
+                template._tags[match] = locations
+                continue
+            if locations[0][0] >= old_end:
+                tails.append((match, locations))
+                continue
+            head_end = bisect.bisect_left(locations, (start,))
+            if head_end:
+                template._tags[match] = locations[:head_end]
+            tail_start = bisect.bisect_left(locations, (old_end,))
+            if tail_start < len(locations):
+                tails.append((match, locations[tail_start:]))
+        for match, locations in middle._tags.items():
+            template._tags[match] = template._tags.get(match, []) + locations
+        tails.sort(key=lambda tail: tail[1][0])
+        for match, locations in tails:
+            if shift:
+                locations = [
+                    (location_start + shift, location_end + shift)
+                    for location_start, location_end in locations
+                ]
+            template._tags[match] = template._tags.get(match, []) + locations
+        return template
+
+    @classmethod
+    def iter_blocks(cls, template_file, block_size=1 << 22):
+        """Read `template_file` incrementally and yield `(offset, text)`
+        blocks of about `block_size` characters that never split a tag.
+        """
+        pending = ""
+        offset = 0
+        for block in iter(lambda: template_file.read(block_size), ""):
+            text = pending + block
+            # a partial tag contains no "}" except for its last character
+            partial = cls._partial_tag_re.search(
+                text, text.rfind("}", 0, len(text) - 1) + 1
             )
-            out_q.put(result)
-    out_q.put(None)
+            cut = len(text) if partial is None else partial.start()
+            if cut > 0:
+                yield offset, text[:cut]
+            pending = text[cut:]
+            offset += cut
+        if pending:
+            yield offset, pending
+
+    @classmethod
+    def scan_key_paths(cls, template_file, block_size=1 << 22):
+        """The data keys referenced by the tags of `template_file`, read
+        incrementally without compiling it.
+        """
+        matches = set()
+        for _, text in cls.iter_blocks(template_file, block_size):
+            matches.update(cls._tag_re.findall(text))
+        return {match[2:-2].split("|")[0] for match in matches}
+
+    def render(
+        self,
+        data,
+        *,
+        verbose=False,
+        force=False,
+        number_of_workers=1,
+        default=None,
+        executor="auto"
+    ):
+        if verbose:
+            for match, locations in self.invalid_tags:
+                _print_tag(match, locations)
+        if not self._tags:
+            return self.fill({}, force, default)
+        if not isinstance(executor, Executor):
+            executor = Executor.make_executor(executor, number_of_workers)
+        results = executor.compute(
+            list(self._tags.items()), data, verbose, force, default
+        )
+        return self.fill(results, force, default)
+
+    def fill(self, results, force=False, default=None):
+        """Join the nodes with the tag `results`, a dict of match -> str,
+        tags without a result are left as they are or set to `default`.
+        """
+        fallback = None if not force or default is None else default
+        nodes = self._nodes.copy()
+        for index in self._tag_indices:
+            match = nodes[index]
+            res = results.get(match)
+            if res is None:
+                res = match if fallback is None else fallback
+            nodes[index] = res
+        return "".join(nodes)
 
 
 def fill_template(
@@ -324,52 +1832,915 @@ def fill_template(
     verbose=False,
     force=False,
     number_of_workers=1,
-    default=None
+    default=None,
+    executor="auto"
 ):
-    processes = []
-    total_tasks = 0
-    in_q = mp.Queue()
-    out_q = mp.Queue()
-
-    for match in re.compile(r"{{[^\}]*}}").finditer(template_text):
-        in_q.put((match.group(0), match.span()))
-        if total_tasks < number_of_workers:
-            p = mp.Process(
-                target=_worker,
-                args=(in_q, out_q, data, verbose, force, default)
+    template = (
+        template_text
+        if isinstance(template_text, Template) else
+        Template(template_text)
+    )
+    return template.render(
+        data,
+        verbose=verbose,
+        force=force,
+        number_of_workers=number_of_workers,
+        default=default,
+        executor=executor
+    )
+
+
+def stream_template(
+    template_file,
+    data,
+    *,
+    verbose=False,
+    force=False,
+    number_of_workers=1,
+    default=None,
+    executor="auto",
+    block_size=1 << 22
+):
+    """Render the template read from `template_file` block by block and
+    yield the rendered text of each block as soon as its tags are done.
+
+    Only one block of the template is held in memory at a time. Results of
+    tags are kept for the following blocks up to `block_size` characters,
+    the least recently used ones are dropped first and evaluated again if
+    they come up later. Unresolved tags aren't kept, so they are reported
+    at every location.
+    """
+    if not isinstance(executor, Executor):
+        executor = Executor.make_executor(executor, number_of_workers)
+    kept = OrderedDict()
+    kept_size = 0
+    for offset, text in Template.iter_blocks(template_file, block_size):
+        template = Template(text, offset)
+        if verbose:
+            for match, locations in template.invalid_tags:
+                _print_tag(match, locations)
+        results = {}
+        tags = []
+        for tag in template._tags.items():
+            if tag[0] in kept:
+                kept.move_to_end(tag[0])
+                results[tag[0]] = kept[tag[0]]
+                if verbose:
+                    _print_tag(*tag)
+            else:
+                tags.append(tag)
+        if tags:
+            computed = executor.compute(tags, data, verbose, force, default)
+            results.update(computed)
+            for match, res in computed.items():
+                if res in (match, default):
+                    continue
+                kept[match] = res
+                kept_size += len(res)
+            while kept_size > block_size:
+                kept_size -= len(kept.popitem(last=False)[1])
+        yield template.fill(results, force, default)
+
+
+def fill_templates(
+    templates,
+    data,
+    *,
+    verbose=False,
+    force=False,
+    number_of_workers=1,
+    default=None,
+    executor="auto"
+):
+    """Render many templates from the same `data`. `templates` are
+    `(name, template)` pairs of a text or `Template` each, the rendered
+    `(name, text)` pairs are yielded in the same order.
+
+    The distinct tags of all templates are evaluated together by one
+    executor, so its workers and their filter caches are shared and stay
+    busy even for small templates. Tags repeated across templates are
+    evaluated once, their locations are labeled `(name, start, end)`.
+    """
+    templates = [
+        (
+            name,
+            template
+            if isinstance(template, Template) else
+            Template(template)
+        )
+        for name, template in templates
+    ]
+    tags = {}
+    for name, template in templates:
+        if verbose:
+            for match, locations in template.invalid_tags:
+                _print_tag(
+                    match, [(name, start, end) for start, end in locations]
+                )
+        for match, locations in template._tags.items():
+            tags.setdefault(match, []).extend(
+                (name, start, end) for start, end in locations
             )
-            processes.append(p)
-            p.start()
-            total_tasks += 1
+    results = {}
+    if tags:
+        if not isinstance(executor, Executor):
+            executor = Executor.make_executor(executor, number_of_workers)
+        results = executor.compute(
+            list(tags.items()), data, verbose, force, default
+        )
+    for name, template in templates:
+        yield name, template.fill(results, force, default)
+
+
+# read once while importing, setting it to read it isn't thread safe
+_umask = os.umask(0)
+os.umask(_umask)
 
-    for _ in range(total_tasks):
-        in_q.put(None)
 
-    while total_tasks > 0:
-        result = out_q.get()
-        if result is None:
-            total_tasks -= 1
+def _atomic_write(path, chunks, mode="w"):
+    """Write `chunks` to a temporary file next to `path` and move it into
+    place, so readers only ever see complete files. The file keeps its
+    permissions, a new one gets those `open` would give it.
+    """
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.writelines(chunks)
+        try:
+            permissions = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            permissions = 0o666 & ~_umask
+        os.chmod(tmp_path, permissions)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class RenderCache:
+    """On-disk cache of compiled templates and rendered tag results.
+
+    Templates are stored by the digest of their text and the filter
+    registry version. The tag results of a template are stored together
+    with the digest of the data file and of the value each tag refers to,
+    so after the data changed only the tags whose value changed are
+    evaluated again. All files are replaced atomically, concurrent runs
+    can share a directory and the last writer wins.
+    """
+    __slots__ = ('directory', '_templates')
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._templates = {}
+        os.makedirs(os.path.join(directory, "templates"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "fragments"), exist_ok=True)
+
+    @staticmethod
+    def _digest(*parts):
+        import hashlib
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part if isinstance(part, bytes) else part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    @staticmethod
+    def file_digest(path):
+        import hashlib
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _load(self, *path):
+        try:
+            with open(os.path.join(self.directory, *path), "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            # unreadable, cut off or written by an incompatible version,
+            # e.g. with classes of a module that can't be imported here
+            return None
+
+    def _store(self, obj, *path):
+        _atomic_write(
+            os.path.join(self.directory, *path), [pickle.dumps(obj)], "wb"
+        )
+
+    def template(self, template_text):
+        """Return the compiled `template_text` and its cache key."""
+        key = self._digest(template_text, Filter.registry_version())
+        template = self._templates.get(key)
+        if template is not None:
+            return template, key
+        # stored as plain data, a pickled Template would refer to the
+        # module it was defined in, `__main__` when run as a script
+        state = self._load("templates", key)
+        template = Template.from_dict(state) if isinstance(
+            state, dict
+        ) else None
+        if template is not None:
+            template.log_errors()
+        else:
+            template = Template(template_text)
+            self._store(template.to_dict(), "templates", key)
+        self._templates[key] = template
+        return template, key
+
+    def render(
+        self,
+        template_text,
+        data,
+        data_digest=None,
+        *,
+        verbose=False,
+        force=False,
+        number_of_workers=1,
+        default=None,
+        executor="auto"
+    ):
+        template, key = self.template(template_text)
+        stored = self._load("fragments", key) or {"data": None, "tags": {}}
+        data_unchanged = data_digest is not None and (
+            stored["data"] == data_digest
+        )
+
+        results = {}
+        fragments = {}
+        missing = []
+        value_digests = {}
+        for match, locations in template.tags:
+            if data_unchanged and match in stored["tags"]:
+                fragments[match] = stored["tags"][match]
+                results[match] = fragments[match][1]
+                continue
+            data_key = match[2:-2].split("|")[0]
+            if data_key not in value_digests:
+                try:
+                    value_digests[data_key] = self._digest(
+                        pickle.dumps(data[data_key])
+                    )
+                except (MissingKeyError, pickle.PicklingError):
+                    value_digests[data_key] = None
+            value_digest = value_digests[data_key]
+            cached = stored["tags"].get(match)
+            if value_digest is not None and cached is not None and (
+                cached[0] == value_digest
+            ):
+                fragments[match] = cached
+                results[match] = cached[1]
+            else:
+                missing.append((match, locations, value_digest))
+
+        if missing:
+            if not isinstance(executor, Executor):
+                executor = Executor.make_executor(executor, number_of_workers)
+            computed = executor.compute(
+                [(match, locations) for match, locations, _ in missing],
+                data,
+                verbose,
+                force,
+                default
+            )
+            for match, _, value_digest in missing:
+                res = computed.get(match)
+                results[match] = res
+                # unresolved tags fall back to their text or the default
+                if value_digest is not None and res not in (match, default):
+                    fragments[match] = (value_digest, res)
+
+        if missing or stored["data"] != data_digest:
+            self._store(
+                {"data": data_digest, "tags": fragments},
+                "fragments",
+                key
+            )
+        return template.fill(results, force, default)
+
+
+# == Watch
+class Watcher:
+    """Keeps a template and its data in memory and renders them to
+    `output_path` again whenever one of their files changed.
+
+    After an edit of the data only the tags whose value changed are
+    evaluated again. After an edit of the template only the changed
+    region is recompiled and only tags that are new are evaluated.
+    """
+    __slots__ = (
+        'template_path', 'data_path', 'output_path', 'data_type',
+        'interval', 'verbose', 'force', 'default', 'executor',
+        '_states', '_template_text', '_template', '_data', '_digests',
+        '_results'
+    )
+
+    def __init__(
+        self,
+        template_path,
+        data_path,
+        output_path,
+        data_type,
+        *,
+        verbose=False,
+        force=False,
+        number_of_workers=1,
+        default=None,
+        executor="auto",
+        interval=0.5
+    ):
+        self.template_path = template_path
+        self.data_path = data_path
+        self.output_path = output_path
+        self.data_type = data_type
+        self.interval = interval
+        self.verbose = verbose
+        self.force = force
+        self.default = default
+        if not isinstance(executor, Executor):
+            executor = Executor.make_executor(executor, number_of_workers)
+        self.executor = executor
+        self._states = (None, None)
+        self._template_text = None
+        self._template = None
+        self._data = None
+        # data key -> digest of its value, None if missing
+        self._digests = {}
+        # match -> result
+        self._results = {}
+
+    @staticmethod
+    def _state(path):
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _digest(self, data, key):
+        try:
+            return RenderCache._digest(pickle.dumps(data[key]))
+        except MissingKeyError:
+            return None
+        except pickle.PicklingError:
+            # can't tell whether it changed, so it always did
+            return object()
+
+    def update(self):
+        """Render again if a file changed since the last call, returns
+        whether the output was written.
+        """
+        states = (
+            self._state(self.template_path), self._state(self.data_path)
+        )
+        if states == self._states:
+            return False
+        template_changed = states[0] != self._states[0]
+        data_changed = states[1] != self._states[1]
+        # a broken file is only retried after its next change
+        self._states = states
+        start = time.perf_counter()
+
+        template = self._template
+        template_text = self._template_text
+        if template_changed:
+            with open(self.template_path) as f:
+                template_text = f.read()
+            template = (
+                Template(template_text)
+                if template is None else
+                template.recompile(self._template_text, template_text)
+            )
+        key_paths = template.key_paths
+
+        data = self._data
+        digests = dict(self._digests)
+        changed = set()
+        if data_changed or (
+            # only holds the keys of the previous template
+            isinstance(data, LazyJSON_DataContainer) and
+            not key_paths <= digests.keys()
+        ):
+            with open(self.data_path) as f:
+                data = DataContainer.make_container(
+                    self.data_type, f, key_paths=key_paths
+                )
+            digests = {key: self._digest(data, key) for key in key_paths}
+            changed = {
+                key for key in key_paths
+                if digests[key] != self._digests.get(key)
+            }
+        else:
+            for key in key_paths - digests.keys():
+                digests[key] = self._digest(data, key)
+
+        results = {
+            match: res
+            for match, res in self._results.items()
+            if match in template._tags and
+            match[2:-2].split("|")[0] not in changed
+        }
+        tags = [
+            tag for tag in template._tags.items() if tag[0] not in results
+        ]
+        if tags:
+            results.update(self.executor.compute(
+                tags, data, self.verbose, self.force, self.default
+            ))
+        _atomic_write(
+            self.output_path,
+            [template.fill(results, self.force, self.default)]
+        )
+
+        self._template_text = template_text
+        self._template = template
+        self._data = data
+        self._digests = {key: digests[key] for key in key_paths}
+        self._results = results
+        logger.info(
+            f"Rendered O=\"{self.output_path}\", evaluated {len(tags)} of "
+            f"{len(template._tags)} tags in "
+            f"{time.perf_counter() - start:.3f}s"
+        )
+        return True
+
+    def run(self):
+        """Render whenever a file changed, until interrupted."""
+        try:
+            while True:
+                try:
+                    self.update()
+                except (OSError, ValueError) as e:
+                    logger.warning(f"<!> could not render --> {e}")
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
+
+
+# == Server
+def _parse_address(address):
+    """`[host]:port` is served over HTTP, anything else is the path of a
+    Unix socket.
+    """
+    host, _, port = address.rpartition(":")
+    if port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+class _ServedFile:
+    """A file loaded by the server and the state it was loaded in."""
+    __slots__ = ('state', 'digest', 'value', 'key_paths', 'results')
+
+    def __init__(self, state, digest, value, key_paths=None):
+        self.state = state
+        self.digest = digest
+        self.value = value
+        # the only keys a lazy data container holds, None for all
+        self.key_paths = key_paths
+        # (force, default) -> match -> result
+        self.results = {}
+
+
+class RenderServer:
+    """Renders templates on request, keeping a warm worker pool, compiled
+    templates, loaded data and tag results in memory between requests.
+
+    Files are checked by mtime and size on every request and only loaded
+    again if the digest of their content changed too. The tag results of a
+    data file are kept until it changes, so they are shared by all the
+    templates rendered from it. At most `max_files` templates and data
+    files each are kept, the least recently used are dropped first.
+    """
+    __slots__ = (
+        'executor',
+        'pool',
+        'max_files',
+        '_templates',
+        '_data',
+        '_latencies',
+        '_requests',
+        '_lock'
+    )
+
+    def __init__(
+        self,
+        *,
+        number_of_workers=1,
+        executor="auto",
+        max_files=256,
+        latency_window=1024
+    ):
+        self.pool = None
+        if executor in ("process", "auto") and number_of_workers > 1:
+            self.pool = _PoolExecutor(number_of_workers)
+            executor = (
+                self.pool
+                if executor == "process" else
+                _WarmAutoExecutor(self.pool)
+            )
+        elif not isinstance(executor, Executor):
+            # a single process worker is never worth it
+            executor = Executor.make_executor(
+                "serial" if executor in ("process", "auto") else executor,
+                number_of_workers
+            )
+        self.executor = executor
+        self.max_files = max_files
+        self._templates = OrderedDict()
+        self._data = OrderedDict()
+        self._latencies = deque(maxlen=latency_window)
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    def _fresh(self, files, key, path):
+        """The file cached as `key` in `files`, None if `path` changed."""
+        served = files.get(key)
+        if served is None:
+            return None
+        files.move_to_end(key)
+        state = Watcher._state(path)
+        if served.state != state:
+            if RenderCache.file_digest(path) != served.digest:
+                del files[key]
+                return None
+            served.state = state
+        return served
+
+    def _add(self, files, key, served):
+        files[key] = served
+        while len(files) > self.max_files:
+            files.popitem(last=False)
+        return served
+
+    def _template(self, path):
+        served = self._fresh(self._templates, path, path)
+        if served is None:
+            state = Watcher._state(path)
+            digest = RenderCache.file_digest(path)
+            with open(path) as f:
+                template = Template(f.read())
+            served = self._add(
+                self._templates, path, _ServedFile(state, digest, template)
+            )
+        return served
+
+    def _data_file(self, path, data_type, key_paths):
+        key = (path, data_type)
+        served = self._fresh(self._data, key, path)
+        if served is not None and (
+            served.key_paths is None or key_paths <= served.key_paths
+        ):
+            return served
+        if served is not None:
+            # same content, only more keys are needed
+            key_paths = key_paths | served.key_paths
+        state = Watcher._state(path)
+        digest = RenderCache.file_digest(path)
+        data = DataContainer.make_container(
+            data_type, path, key_paths=key_paths
+        )
+        loaded = _ServedFile(
+            state,
+            digest,
+            data,
+            key_paths if isinstance(data, LazyJSON_DataContainer) else None
+        )
+        if served is not None and served.digest == digest:
+            loaded.results = served.results
+        return self._add(self._data, key, loaded)
+
+    def render(
+        self,
+        template_path,
+        data_path,
+        output_path=None,
+        data_type=None,
+        *,
+        verbose=False,
+        force=False,
+        default=None
+    ):
+        """Render `template_path` with `data_path` and write the result to
+        `output_path`. Returns what was done as a dict, with the rendered
+        text if there is no `output_path`.
+        """
+        data_type = data_type or os.path.splitext(data_path)[1][1:]
+        template = self._template(template_path).value
+        served = self._data_file(data_path, data_type, template.key_paths)
+        results = served.results.setdefault((force, default), {})
+        tags = [
+            tag for tag in template._tags.items() if tag[0] not in results
+        ]
+        if tags:
+            results.update(self.executor.compute(
+                tags, served.value, verbose, force, default
+            ))
+        text = template.fill(results, force, default)
+        response = {
+            "ok": True,
+            "tags": len(template._tags),
+            "evaluated": len(tags),
+        }
+        if output_path is None:
+            response["text"] = text
         else:
-            template_text = template_text.replace(*result)
+            _atomic_write(output_path, [text])
+        return response
+
+    def stats(self):
+        """The number of requests and the latencies of the recent ones."""
+        latencies = sorted(self._latencies)
+        stats = {
+            "requests": self._requests,
+            "templates": len(self._templates),
+            "data_files": len(self._data),
+        }
+        if latencies:
+            stats["latency_s"] = {
+                "min": latencies[0],
+                "p50": latencies[max(0, math.ceil(0.5 * len(latencies)) - 1)],
+                "p90": latencies[max(0, math.ceil(0.9 * len(latencies)) - 1)],
+                "p99": latencies[max(0, math.ceil(0.99 * len(latencies)) - 1)],
+                "max": latencies[-1],
+            }
+        return stats
+
+    def handle(self, raw_request):
+        """Answer a JSON request, `{"op": "stats"}` or the arguments of
+        `render` with `"template"`, `"data"`, `"output"` and `"type"` for
+        the paths and data type. Errors are answered, not raised.
+        """
+        start = time.perf_counter()
+        try:
+            request = json.loads(raw_request)
+            if request.get("op", "render") == "stats":
+                with self._lock:
+                    return {"ok": True, **self.stats()}
+            with self._lock:
+                response = self.render(
+                    request["template"],
+                    request["data"],
+                    request.get("output"),
+                    request.get("type"),
+                    verbose=request.get("verbose", False),
+                    force=request.get("force", False),
+                    default=request.get("default")
+                )
+                seconds = time.perf_counter() - start
+                self._requests += 1
+                self._latencies.append(seconds)
+        except Exception as e:
+            # a bad request must not take the server down
+            logger.warning(f"<!> could not answer request --> {e!r}")
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        response["seconds"] = seconds
+        logger.info(
+            f"Rendered T=\"{request['template']}\" "
+            f"O=\"{request.get('output')}\", evaluated "
+            f"{response['evaluated']} of {response['tags']} tags in "
+            f"{seconds * 1000:.1f}ms"
+        )
+        return response
+
+    def serve(self, address, token=None):
+        """Answer requests on `address` until interrupted: JSON lines on a
+        Unix socket, or JSON POSTed to `[host]:port` over HTTP, where a GET
+        returns the stats.
+
+        Over HTTP every request has to carry `token` as
+        "Authorization: Bearer <token>", a random one is printed if none is
+        given. Requests from web pages, which carry an "Origin" header, and
+        POSTs that aren't "application/json" are refused, so a page can't
+        make the server write files.
+        """
+        import socketserver
+        server_address = _parse_address(address)
+        handle = self.handle
+
+        if isinstance(server_address, tuple):
+            import hmac
+            import http.server
+            import secrets
+
+            if token is None:
+                token = secrets.token_urlsafe(16)
+                print(f"Token: {token}", file=sys.stderr)
+            authorization = f"Bearer {token}".encode()
+
+            class Handler(http.server.BaseHTTPRequestHandler):
+                def do_POST(self):
+                    content_type = self.headers.get("Content-Type", "")
+                    if content_type.split(";")[0].strip() != (
+                        "application/json"
+                    ):
+                        self._refuse(415, "expected application/json")
+                    elif self._allowed():
+                        self._respond(handle(self.rfile.read(
+                            int(self.headers["Content-Length"])
+                        )))
+
+                def do_GET(self):
+                    if self._allowed():
+                        self._respond(handle('{"op": "stats"}'))
+
+                def _allowed(self):
+                    if "Origin" in self.headers:
+                        self._refuse(403, "requests from web pages refused")
+                        return False
+                    if not hmac.compare_digest(
+                        self.headers.get("Authorization", "").encode(),
+                        authorization
+                    ):
+                        self._refuse(401, "missing or wrong token")
+                        return False
+                    return True
+
+                def _refuse(self, status, error):
+                    logger.warning(
+                        f"<!> refused request from {self.client_address[0]}"
+                        f" --> {error}"
+                    )
+                    self._respond({"ok": False, "error": error}, status)
+
+                def _respond(self, response, status=None):
+                    body = json.dumps(response).encode()
+                    self.send_response(
+                        status or (200 if response["ok"] else 400)
+                    )
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    # requests are logged by `handle`
+                    pass
+
+            server = http.server.ThreadingHTTPServer(server_address, Handler)
+        else:
+            import socket
+            if os.path.exists(server_address):
+                # left behind by a server that did not stop cleanly
+                with socket.socket(socket.AF_UNIX) as probe:
+                    try:
+                        probe.connect(server_address)
+                    except ConnectionRefusedError:
+                        os.unlink(server_address)
+
+            class Handler(socketserver.StreamRequestHandler):
+                def handle(self):
+                    for line in self.rfile:
+                        self.wfile.write(
+                            json.dumps(handle(line)).encode() + b"\n"
+                        )
+
+            server = socketserver.ThreadingUnixStreamServer(
+                server_address, Handler
+            )
+        server.daemon_threads = True
+
+        if self.pool is not None:
+            self.pool.start()
+        logger.info(f"Serving on {address}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if not isinstance(server_address, tuple):
+                os.unlink(server_address)
+            self.close()
+            logger.info(f"Stopped serving on {address}: {self.stats()}")
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+
+
+# == Batch
+def _render_record(
+    template, index, record, output_pattern, verbose, force, default
+):
+    output_path = output_pattern.format(index=index, record=record)
+    text = template.render(
+        JSON_DataContainer.from_object(record),
+        verbose=verbose,
+        force=force,
+        default=default,
+        executor=SerialExecutor()
+    )
+    with open(output_path, "w") as f:
+        f.write(text)
+    if verbose:
+        print(f"Rendered record {index: >6} to {output_path}")
+    return output_path
 
-    for p in processes:
-        p.join()
 
-    return template_text
+def _batch_worker(
+    in_q, out_q, template, output_pattern, verbose, force, default
+):
+    for work_load in _iter_queue(in_q, out_q):
+        try:
+            out_q.put([
+                _render_record(
+                    template,
+                    index,
+                    record,
+                    output_pattern,
+                    verbose,
+                    force,
+                    default
+                )
+                for index, record in work_load
+            ])
+        except Exception as e:
+            # the parent is waiting for this work load, fail it instead
+            out_q.put(_sendable_error(e))
+
+
+def fill_batch(
+    template_text,
+    records,
+    output_pattern,
+    *,
+    verbose=False,
+    force=False,
+    number_of_workers=1,
+    default=None,
+    executor="auto",
+    chunk_size=16
+):
+    """Render one template once per record and write each result to
+    `output_pattern.format(index=..., record=...)`.
+
+    `records` is consumed lazily, e.g. from `JSON_DataContainer.iter_records`,
+    and the template is only compiled once. Every worker of the pool lives
+    for the whole batch, so its filter cache stays warm across records.
+    Returns the number of rendered records.
+    """
+    template = (
+        template_text
+        if isinstance(template_text, Template) else
+        Template(template_text)
+    )
+    records = enumerate(records)
+    args = (template, output_pattern, verbose, force, default)
+    rendered = 0
+
+    if executor == "auto":
+        auto = AutoExecutor(number_of_workers)
+        start = time.perf_counter()
+        for index, record in itertools.islice(records, auto.sample_size):
+            _render_record(template, index, record, *args[1:])
+            rendered += 1
+        cost_per_record = (time.perf_counter() - start) / max(1, rendered)
+        # look ahead a bounded number of records to estimate what is left
+        lookahead = list(itertools.islice(records, auto.sample_size * 16))
+        records = itertools.chain(lookahead, records)
+        executor = (
+            "process"
+            if auto._prefer_processes(len(lookahead), cost_per_record) else
+            "serial"
+        )
+
+    if executor == "serial":
+        for index, record in records:
+            _render_record(template, index, record, *args[1:])
+            rendered += 1
+        return rendered
+
+    pool = Executor.make_executor(executor, number_of_workers, chunk_size)
+    work_loads = iter(lambda: list(itertools.islice(records, chunk_size)), [])
+    error = None
+    for chunk_results in pool._run(_batch_worker, args, work_loads):
+        if isinstance(chunk_results, Exception):
+            # the workers still finish the other work loads and exit
+            error = error or chunk_results
+            continue
+        rendered += len(chunk_results)
+    if error is not None:
+        raise error
+    return rendered
 
 
 # == CLI
 if __name__ == "__main__":
     import argparse
-    import os
 
     def positive_int(val):
         try:
             i = int(val)
-            if i <= 0:
-                raise argparse.ArgumentTypeError(f"{i} <= 0")
-        except Exception as e:
-            raise argparse.ArgumentTypeError(e.args(0))
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(e.args[0])
+        if i <= 0:
+            raise argparse.ArgumentTypeError(f"{i} <= 0")
+        return i
+
+    def template_source(val):
+        # a directory of templates is filled into the directory O
+        if os.path.isdir(val):
+            return val
+        return argparse.FileType("r")(val)
 
     parser = argparse.ArgumentParser(
         description="Fill a markdown tempalte with json data."
@@ -383,14 +2754,16 @@ if __name__ == "__main__":
     parser.add_argument(
         "template_file",
         metavar="T",
-        type=argparse.FileType("r"),
-        help="the template to fill",
+        type=template_source,
+        help="the template to fill, or a directory of templates",
     )
     parser.add_argument(
         "output_file",
         metavar="O",
-        type=argparse.FileType("w"),
-        help="the file to save the result in",
+        type=str,
+        help="the file to save the result in, '-' for stdout, "
+        "a pattern like 'out/{index}.md' in batch mode, "
+        "a directory if T is one",
     )
     parser.add_argument(
         "-v",
@@ -419,6 +2792,14 @@ if __name__ == "__main__":
         default=mp.cpu_count(),
         help="determin the number of concurrent workers"
     )
+    parser.add_argument(
+        "-e",
+        "--executor",
+        type=str,
+        default="auto",
+        choices=list(Executor._available_executors.keys()),
+        help="how to distribute the tags over the workers"
+    )
     parser.add_argument(
         "-d",
         "--missing_key_default",
@@ -426,37 +2807,205 @@ if __name__ == "__main__":
         default=None,
         help="default value for a missing key"
     )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        action="store_true",
+        help="render once per record of a JSON array or NDJSON data file"
+    )
+    parser.add_argument(
+        "-c",
+        "--cache_size",
+        type=positive_int,
+        default=64,
+        help="memory budget of the filter cache per worker in MiB"
+    )
+    parser.add_argument(
+        "-C",
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="directory to cache compiled templates and tag results in"
+    )
+    parser.add_argument(
+        "-p",
+        "--pair",
+        type=str,
+        nargs=2,
+        metavar=("T", "O"),
+        action="append",
+        default=[],
+        help="another template to fill from the same data and the file to "
+        "save it in, can be repeated"
+    )
+    parser.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="keep running and render again whenever D or T change"
+    )
+    parser.add_argument(
+        "-l",
+        "--log_file",
+        type=str,
+        default="md_template.log",
+        help="file to log to, '' to only log warnings to stderr"
+    )
+    parser.add_argument(
+        "-s",
+        "--stats",
+        action="store_true",
+        help="print where the time went per filter, tag and worker"
+    )
+    parser.add_argument(
+        "-S",
+        "--stats_json",
+        type=str,
+        default=None,
+        help="file to save the stats in as JSON"
+    )
     args = parser.parse_args()
+    template_is_dir = isinstance(args.template_file, str)
+    template_name = (
+        args.template_file if template_is_dir else args.template_file.name
+    )
+    multi = template_is_dir or bool(args.pair)
+    if multi and (args.watch or args.batch or args.cache_dir is not None):
+        parser.error("--watch, --batch and --cache_dir fill a single template")
+    if args.watch and (
+        args.batch or args.cache_dir is not None or args.output_file == "-"
+    ):
+        parser.error(
+            "--watch keeps its state in memory and needs a single output file"
+        )
+    setup_logging(args.log_file or None)
     try:
         mp.set_start_method('spawn')
+        Filter.cache.max_bytes = args.cache_size * 1024 * 1024
+        if args.stats or args.stats_json is not None:
+            RenderStats.current = RenderStats()
         logger.info(
             f"Starting work with D=\"{args.data_file.name}\" "
-            f"T=\"{args.template_file.name}\" O=\"{args.output_file.name}\""
-        )
-        data = DataContainer.make_container(
-            args.type
-            if args.type != 'default' else
-            os.path.splitext(args.data_file.name)[1][1:],
-            args.data_file
+            f"T=\"{template_name}\" O=\"{args.output_file}\""
         )
-        template_text = args.template_file.read()
-        new_text = fill_template(
-            template_text,
-            data,
+        render_kwargs = dict(
             verbose=args.verbose,
             force=args.force,
             number_of_workers=args.number_of_workers,
-            default=args.missing_key_default
+            default=args.missing_key_default,
+            executor=args.executor
         )
-        args.output_file.seek(0)
-        args.output_file.write(new_text)
+        data_type = (
+            args.type
+            if args.type != 'default' else
+            os.path.splitext(args.data_file.name)[1][1:]
+        )
+        if args.cache_dir is not None:
+            cache = RenderCache(args.cache_dir)
+            template_text = args.template_file.read()
+            template, _ = cache.template(template_text)
+            key_paths = template.key_paths
+        elif args.batch:
+            template = Template(args.template_file.read())
+        elif multi:
+            templates = []
+            outputs = []
+            if template_is_dir:
+                os.makedirs(args.output_file, exist_ok=True)
+                pairs = [
+                    (entry.path, os.path.join(args.output_file, entry.name))
+                    for entry in sorted(
+                        os.scandir(args.template_file),
+                        key=lambda entry: entry.name
+                    )
+                    if entry.is_file() and not entry.name.startswith(".")
+                ]
+            else:
+                templates.append(
+                    (template_name, Template(args.template_file.read()))
+                )
+                outputs.append(args.output_file)
+                pairs = []
+            for template_path, output_path in pairs + args.pair:
+                with open(template_path) as f:
+                    templates.append((template_path, Template(f.read())))
+                outputs.append(output_path)
+            key_paths = set().union(
+                *(template.key_paths for _, template in templates)
+            )
+        elif args.template_file.seekable() and not args.watch:
+            # stream the template, after a first pass for its keys
+            key_paths = Template.scan_key_paths(args.template_file)
+            args.template_file.seek(0)
+        else:
+            key_paths = None
+        if args.watch:
+            Watcher(
+                args.template_file.name,
+                args.data_file.name,
+                args.output_file,
+                data_type,
+                **render_kwargs
+            ).run()
+        elif args.batch:
+            rendered = fill_batch(
+                template,
+                JSON_DataContainer.iter_records(args.data_file),
+                args.output_file,
+                **render_kwargs
+            )
+            logger.info(f"Rendered {rendered} records")
+        elif multi:
+            data = DataContainer.make_container(
+                data_type, args.data_file, key_paths=key_paths
+            )
+            for output_path, (_, text) in zip(
+                outputs, fill_templates(templates, data, **render_kwargs)
+            ):
+                if output_path == "-":
+                    sys.stdout.write(text)
+                    sys.stdout.flush()
+                else:
+                    _atomic_write(output_path, [text])
+            logger.info(f"Rendered {len(templates)} templates")
+        else:
+            data = DataContainer.make_container(
+                data_type, args.data_file, key_paths=key_paths
+            )
+            if args.cache_dir is not None:
+                chunks = [
+                    cache.render(
+                        template_text,
+                        data,
+                        RenderCache.file_digest(args.data_file.name),
+                        **render_kwargs
+                    )
+                ]
+            else:
+                chunks = stream_template(
+                    args.template_file, data, **render_kwargs
+                )
+            if args.output_file == "-":
+                for chunk in chunks:
+                    sys.stdout.write(chunk)
+                    sys.stdout.flush()
+            else:
+                _atomic_write(args.output_file, chunks)
     except Exception as e:
         raise e
     finally:
         args.data_file.close()
-        args.template_file.close()
-        args.output_file.close()
+        if not template_is_dir:
+            args.template_file.close()
+        logger.info(f"Filter cache: {Filter.cache.stats()}")
+        if RenderStats.current is not None:
+            RenderStats.current.add_cache(Filter.cache)
+            if args.stats:
+                print(RenderStats.current.report(), file=sys.stderr)
+            if args.stats_json is not None:
+                with open(args.stats_json, "w") as f:
+                    json.dump(RenderStats.current.as_dict(), f, indent=2)
         logger.info(
             f"Done with D=\"{args.data_file.name}\" "
-            f"T=\"{args.template_file.name}\" O=\"{args.output_file.name}\""
+            f"T=\"{template_name}\" O=\"{args.output_file}\""
         )
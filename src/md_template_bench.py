@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+import itertools
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import multiprocessing as mp
+
+import md_template
+
+
+# == Synthetic data
+# filter name -> tag for member %d, every one hits a different value type
+TAG_KINDS = {
+    "bold": "{{project.members.%d.name|bold}}",
+    "date": "{{project.members.%d.joined|date(%%Y)}}",
+    "frmt": "{{project.members.%d.score|frmt(.2f)}}",
+    "for_each": "{{project.members.%d.skills|for_each(italic)|join(, )}}",
+    "tabularize": "{{project.members.%d.history|tabularize(year,role)}}",
+}
+
+
+def make_data(number_of_keys, history=5, seed=0):
+    rng = random.Random(seed)
+    return {
+        "project": {
+            "name": "Benchmark",
+            "members": [
+                {
+                    "name": f"member {i}",
+                    "joined": f"2018-07-{i % 28 + 1:02}T12:{i % 60:02}:00",
+                    "score": rng.random() * 100,
+                    "skills": [f"skill {j}" for j in range(i % 4 + 1)],
+                    "history": [
+                        {"year": 2010 + j, "role": f"role {(i + j) % 7}"}
+                        for j in range(history)
+                    ],
+                }
+                for i in range(number_of_keys)
+            ],
+        }
+    }
+
+
+def make_template(
+    number_of_tags, unique_ratio, number_of_keys, mix=("bold",), seed=0
+):
+    """A template of `number_of_tags` tags, `unique_ratio` of them distinct,
+    cycling through the filter `mix` over the members of the data.
+    """
+    rng = random.Random(seed)
+    unique_tags = [
+        TAG_KINDS[mix[i % len(mix)]] % (i // len(mix) % number_of_keys)
+        for i in range(max(1, int(number_of_tags * unique_ratio)))
+    ]
+    tags = unique_tags + [
+        rng.choice(unique_tags)
+        for _ in range(number_of_tags - len(unique_tags))
+    ]
+    rng.shuffle(tags)
+    return "".join(f"line {i}: {tag}\n" for i, tag in enumerate(tags))
+
+
+# == Measuring
+def _percentile(values, q):
+    """Nearest-rank percentile of the sorted `values`."""
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+class _WorkerMemory:
+    """Samples the peak RSS of the child processes while running, the
+    RSS high-water mark of exited children reported by `getrusage` is
+    inherited from the parent and useless here.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            for child in mp.active_children():
+                try:
+                    with open(f"/proc/{child.pid}/status") as f:
+                        for line in f:
+                            if line.startswith("VmHWM:"):
+                                self.peak[child.pid] = max(
+                                    self.peak.get(child.pid, 0),
+                                    int(line.split()[1]) * 1024
+                                )
+                except OSError:
+                    pass
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def _peak_rss():
+    # kilobytes on linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def run_scenario(
+    number_of_tags,
+    unique_ratio,
+    mix,
+    number_of_keys,
+    number_of_workers,
+    executor,
+    repeat
+):
+    md_template.logger.setLevel("ERROR")
+    with tempfile.TemporaryDirectory() as directory:
+        data_path = os.path.join(directory, "data.json")
+        with open(data_path, "w") as f:
+            json.dump(make_data(number_of_keys), f)
+        start = time.perf_counter()
+        with open(data_path) as f:
+            data = md_template.JSON_DataContainer(f)
+        load_time = time.perf_counter() - start
+        data_bytes = os.path.getsize(data_path)
+
+    template_text = make_template(
+        number_of_tags, unique_ratio, number_of_keys, mix
+    )
+    start = time.perf_counter()
+    template = md_template.Template(template_text)
+    compile_time = time.perf_counter() - start
+
+    latencies = []
+    with _WorkerMemory() as workers:
+        for _ in range(repeat):
+            md_template.Filter.cache.clear()
+            start = time.perf_counter()
+            template.render(
+                data,
+                number_of_workers=number_of_workers,
+                executor=executor
+            )
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "data_bytes": data_bytes,
+        "distinct_tags": len(template.tags),
+        "load_s": load_time,
+        "compile_s": compile_time,
+        "latency_s": {
+            "min": latencies[0],
+            "p50": _percentile(latencies, 0.5),
+            "p90": _percentile(latencies, 0.9),
+            "p99": _percentile(latencies, 0.99),
+            "max": latencies[-1],
+        },
+        "tags_per_s": number_of_tags / _percentile(latencies, 0.5),
+        "peak_rss_bytes": _peak_rss(),
+        "worker_peak_rss_bytes": max(workers.peak.values(), default=0),
+    }
+
+
+def _isolated_process(out_q, func, *args):
+    out_q.put(func(*args))
+
+
+def run_isolated(*args, func=run_scenario):
+    """Run a scenario in a fresh process, so caches and peak memory are
+    not carried over from the previous ones.
+    """
+    ctx = mp.get_context("spawn")
+    out_q = ctx.Queue()
+    process = ctx.Process(
+        target=_isolated_process, args=(out_q, func, *args)
+    )
+    process.start()
+    result = out_q.get()
+    process.join()
+    return result
+
+
+_IMPORT_SNIPPET = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "import md_template\n"
+    "print(time.perf_counter() - start)\n"
+)
+
+
+def run_startup(number_of_workers, number_of_tags, number_of_keys, repeat):
+    """Render with a fresh pool of `number_of_workers` process workers,
+    from starting them until all of them exited, and sample the memory of
+    the parent and of the workers.
+    """
+    md_template.logger.setLevel("ERROR")
+    data = md_template.JSON_DataContainer.from_object(
+        make_data(number_of_keys)
+    )
+    tags = md_template.Template(
+        make_template(number_of_tags, 1.0, number_of_keys)
+    ).tags
+    times = []
+    worker_peak = 0
+    workers_peak = 0
+    for _ in range(repeat):
+        with _WorkerMemory() as workers:
+            start = time.perf_counter()
+            md_template.ProcessExecutor(number_of_workers).compute(
+                tags, data, False, False, None
+            )
+            times.append(time.perf_counter() - start)
+        worker_peak = max(worker_peak, *workers.peak.values(), 0)
+        workers_peak = max(workers_peak, sum(workers.peak.values()))
+    times.sort()
+    return {
+        "worker_s": {
+            "min": times[0],
+            "p50": _percentile(times, 0.5),
+            "max": times[-1],
+        },
+        "peak_rss_bytes": _peak_rss(),
+        "worker_peak_rss_bytes": worker_peak,
+        # the parent and all workers of one render together
+        "total_peak_rss_bytes": _peak_rss() + workers_peak,
+    }
+
+
+def bench_startup(repeat, workers=(1, 4, 16), tags=2000, keys=1000):
+    """Time importing md_template in a fresh interpreter, and rendering
+    `tags` tags over `keys` members with fresh pools of every number of
+    `workers` process workers, with their peak memory.
+    """
+    import_times = [
+        float(subprocess.run(
+            [sys.executable, "-c", _IMPORT_SNIPPET],
+            cwd=os.path.dirname(os.path.abspath(md_template.__file__)),
+            stdout=subprocess.PIPE,
+            check=True,
+            text=True
+        ).stdout)
+        for _ in range(repeat)
+    ]
+
+    import_times.sort()
+    results = {
+        "import_s": {
+            "min": import_times[0],
+            "p50": _percentile(import_times, 0.5),
+            "max": import_times[-1],
+        },
+        "workers": {},
+    }
+    for number_of_workers in workers:
+        result = run_isolated(
+            number_of_workers, tags, keys, repeat, func=run_startup
+        )
+        results["workers"][number_of_workers] = result
+        print(
+            f"workers={number_of_workers}: "
+            f"p50 {result['worker_s']['p50']:.3f}s "
+            f"worker peak {result['worker_peak_rss_bytes'] / 2 ** 20:.0f} MiB "
+            f"total peak {result['total_peak_rss_bytes'] / 2 ** 20:.0f} MiB",
+            file=sys.stderr
+        )
+    return results
+
+
+def scenario_name(tags, unique_ratio, mix, keys, workers, executor):
+    return (
+        f"tags={tags} unique={unique_ratio:g} mix={','.join(mix)} "
+        f"keys={keys} workers={workers} executor={executor}"
+    )
+
+
+# == Comparing
+def compare(results, baseline, threshold):
+    """Yield `(name, metric, old, new)` for every scenario that got slower
+    or bigger than its `baseline` by more than `threshold`. Speed is judged
+    by the median, the tail latencies of a few renders are too noisy.
+    """
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        if result["tags_per_s"] < old["tags_per_s"] * (1 - threshold):
+            yield name, "tags_per_s", old["tags_per_s"], result["tags_per_s"]
+        for metric in ("peak_rss_bytes", "worker_peak_rss_bytes"):
+            if result[metric] > old[metric] * (1 + threshold) and (
+                # ignore the noise of small processes
+                result[metric] - old[metric] > 8 * 1024 * 1024
+            ):
+                yield name, metric, old[metric], result[metric]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark md_template over a grid of scenarios."
+    )
+    parser.add_argument(
+        "-t",
+        "--tags",
+        type=int,
+        nargs="+",
+        default=[10000],
+        help="numbers of tags in the template"
+    )
+    parser.add_argument(
+        "-u",
+        "--unique_ratio",
+        type=float,
+        nargs="+",
+        default=[0.01, 1.0],
+        help="shares of distinct tags, the rest are repeats"
+    )
+    parser.add_argument(
+        "-m",
+        "--mix",
+        type=str,
+        nargs="+",
+        default=["bold", ",".join(TAG_KINDS)],
+        help="comma separated filter mixes, out of "
+        f"{','.join(TAG_KINDS)}"
+    )
+    parser.add_argument(
+        "-k",
+        "--keys",
+        type=int,
+        nargs="+",
+        default=[1000],
+        help="numbers of members in the data, sets the data file size"
+    )
+    parser.add_argument(
+        "-n",
+        "--number_of_workers",
+        type=int,
+        nargs="+",
+        default=None,
+        help="numbers of workers to render with, "
+        "1 or for --startup 1 4 16"
+    )
+    parser.add_argument(
+        "-e",
+        "--executor",
+        type=str,
+        nargs="+",
+        default=["serial"],
+        choices=list(md_template.Executor._available_executors.keys()),
+        help="executors to render with"
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=5,
+        help="number of timed renders per scenario"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=None,
+        help="file to save the results in as JSON, usable as a baseline"
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        type=str,
+        default=None,
+        help="results to compare against, regressions fail the run"
+    )
+    parser.add_argument(
+        "-T",
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative change that counts as a regression"
+    )
+    parser.add_argument(
+        "-s",
+        "--startup",
+        action="store_true",
+        help="only time the import of md_template and renders of fresh "
+        "process workers, of the first tags and keys"
+    )
+    args = parser.parse_args()
+    if args.startup:
+        mp.set_start_method("spawn")
+        print(json.dumps(bench_startup(
+            args.repeat,
+            args.number_of_workers or [1, 4, 16],
+            args.tags[0],
+            args.keys[0]
+        ), indent=2))
+        sys.exit()
+    args.number_of_workers = args.number_of_workers or [1]
+    for mix in args.mix:
+        for kind in mix.split(","):
+            if kind not in TAG_KINDS:
+                parser.error(f"unkown filter \"{kind}\" in mix \"{mix}\"")
+
+    results = {}
+    for tags, unique_ratio, mix, keys, workers, executor in itertools.product(
+        args.tags,
+        args.unique_ratio,
+        [tuple(mix.split(",")) for mix in args.mix],
+        args.keys,
+        args.number_of_workers,
+        args.executor
+    ):
+        name = scenario_name(
+            tags, unique_ratio, mix, keys, workers, executor
+        )
+        result = run_isolated(
+            tags, unique_ratio, mix, keys, workers, executor, args.repeat
+        )
+        results[name] = result
+        print(
+            f"{name}: p50 {result['latency_s']['p50']:.3f}s "
+            f"p90 {result['latency_s']['p90']:.3f}s "
+            f"({result['tags_per_s']:,.0f} tags/s) "
+            f"peak {result['peak_rss_bytes'] / 2 ** 20:.0f} MiB",
+            file=sys.stderr
+        )
+
+    report = json.dumps(results, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = list(compare(results, baseline, args.threshold))
+        for name, metric, old, new in regressions:
+            print(
+                f"<!> {name}: {metric} {old:,.3f} -> {new:,.3f}",
+                file=sys.stderr
+            )
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+import json
+import os
+import socket
+import sys
+import time
+
+
+def parse_address(address):
+    """`[host]:port` is served over HTTP, anything else is the path of a
+    Unix socket. Kept in sync with `md_template._parse_address`, importing
+    md_template would cost more than the whole request.
+    """
+    host, _, port = address.rpartition(":")
+    if port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def request(address, message, token=None):
+    """Send `message` to the md_template server at `address` and return
+    its response. Over HTTP `token` is the one the server was started with.
+    """
+    address = parse_address(address)
+    body = json.dumps(message).encode()
+    if isinstance(address, tuple):
+        import http.client
+        connection = http.client.HTTPConnection(*address)
+        try:
+            connection.request("POST", "/", body, {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {token}",
+            })
+            return json.loads(connection.getresponse().read())
+        finally:
+            connection.close()
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.connect(address)
+        sock.sendall(body + b"\n")
+        with sock.makefile("rb") as f:
+            return json.loads(f.readline())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Fill a markdown template with json data "
+        "on a running md_template_server."
+    )
+    parser.add_argument(
+        "address",
+        metavar="A",
+        type=str,
+        help="path of the server's Unix socket, or '[host]:port'"
+    )
+    parser.add_argument(
+        "data_file",
+        metavar="D",
+        type=str,
+        help="the data file to source from",
+    )
+    parser.add_argument(
+        "template_file",
+        metavar="T",
+        type=str,
+        help="the template to fill",
+    )
+    parser.add_argument(
+        "output_file",
+        metavar="O",
+        type=str,
+        help="the file to save the result in, '-' for stdout",
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="apply default to syntax errors"
+    )
+    parser.add_argument(
+        "-t",
+        "--type",
+        type=str,
+        default=None,
+        help="read data file as certain type, e.g. json or lazy_json"
+    )
+    parser.add_argument(
+        "-d",
+        "--missing_key_default",
+        type=str,
+        default=None,
+        help="default value for a missing key"
+    )
+    parser.add_argument(
+        "-L",
+        "--latency",
+        action="store_true",
+        help="print the latency of the request and of the server"
+    )
+    parser.add_argument(
+        "-k",
+        "--token",
+        type=str,
+        default=os.environ.get("MD_TEMPLATE_TOKEN"),
+        help="token of a server on '[host]:port', "
+        "defaults to $MD_TEMPLATE_TOKEN"
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    # the server has its own working directory
+    response = request(args.address, {
+        "template": os.path.abspath(args.template_file),
+        "data": os.path.abspath(args.data_file),
+        "output": (
+            None
+            if args.output_file == "-" else
+            os.path.abspath(args.output_file)
+        ),
+        "type": args.type,
+        "force": args.force,
+        "default": args.missing_key_default,
+    }, args.token)
+    seconds = time.perf_counter() - start
+    if not response["ok"]:
+        sys.exit(f"<!> {response['error']}")
+    if args.output_file == "-":
+        sys.stdout.write(response["text"])
+    if args.latency:
+        stats = request(args.address, {"op": "stats"}, args.token)
+        print(
+            f"request {seconds * 1000:.1f}ms, "
+            f"render {response['seconds'] * 1000:.1f}ms, "
+            f"evaluated {response['evaluated']} of {response['tags']} tags\n"
+            f"server p50 {stats['latency_s']['p50'] * 1000:.1f}ms "
+            f"p90 {stats['latency_s']['p90'] * 1000:.1f}ms "
+            f"p99 {stats['latency_s']['p99'] * 1000:.1f}ms "
+            f"over {min(stats['requests'], 1024)} of "
+            f"{stats['requests']} requests",
+            file=sys.stderr
+        )
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+import multiprocessing as mp
+import os
+import signal
+import sys
+
+import md_template
+
+
+if __name__ == "__main__":
+    import argparse
+
+    def positive_int(val):
+        try:
+            i = int(val)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(e.args[0])
+        if i <= 0:
+            raise argparse.ArgumentTypeError(f"{i} <= 0")
+        return i
+
+    parser = argparse.ArgumentParser(
+        description="Serve md_template renders from a warm worker pool."
+    )
+    parser.add_argument(
+        "address",
+        metavar="A",
+        type=str,
+        help="path of a Unix socket, or '[host]:port' to serve over HTTP"
+    )
+    parser.add_argument(
+        "-n",
+        "--number_of_workers",
+        type=positive_int,
+        default=mp.cpu_count(),
+        help="determin the number of concurrent workers"
+    )
+    parser.add_argument(
+        "-e",
+        "--executor",
+        type=str,
+        default="auto",
+        choices=list(md_template.Executor._available_executors.keys()),
+        help="how to distribute the tags over the workers"
+    )
+    parser.add_argument(
+        "-c",
+        "--cache_size",
+        type=positive_int,
+        default=64,
+        help="memory budget of the filter cache per worker in MiB"
+    )
+    parser.add_argument(
+        "-m",
+        "--max_files",
+        type=positive_int,
+        default=256,
+        help="number of templates and of data files to keep loaded"
+    )
+    parser.add_argument(
+        "-l",
+        "--log_file",
+        type=str,
+        default="md_template.log",
+        help="file to log to, '' to only log warnings to stderr"
+    )
+    parser.add_argument(
+        "-t",
+        "--token",
+        type=str,
+        default=os.environ.get("MD_TEMPLATE_TOKEN"),
+        help="token HTTP clients have to send, defaults to "
+        "$MD_TEMPLATE_TOKEN or a random one that is printed"
+    )
+    args = parser.parse_args()
+    md_template.setup_logging(args.log_file or None)
+    mp.set_start_method('spawn')
+    md_template.Filter.cache.max_bytes = args.cache_size * 1024 * 1024
+    # stop like on ctrl-c, so the pool and the socket are cleaned up
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit())
+    md_template.RenderServer(
+        number_of_workers=args.number_of_workers,
+        executor=args.executor,
+        max_files=args.max_files
+    ).serve(args.address, args.token)
@@ -1,83 +1,368 @@
 #!/usr/bin/env python
 from __future__ import annotations
-from typing import List, Optional
-from dataclasses import dataclass, field
+from typing import Iterator, NamedTuple, Optional, Sequence
+import contextlib
+import functools
+import gc
+import glob
+import hashlib
+import io
+import itertools
+import json
+import mmap
+import multiprocessing as mp
+import os
 import re
+import shutil
+import tempfile
+import time
 
 
 class MDToC_Exception(Exception):
     ...
 
 
-@dataclass
+# what GitHub drops from a heading to get its anchor
+_slug_re = re.compile(r"[^\w\- ]")
+
+
+def make_slug(title, slugs=None):
+    """The anchor GitHub gives a heading titled `title`. `slugs` counts
+    the anchors of the headings before it, repeated ones get a suffix.
+    """
+    slug = _slug_re.sub("", title.lower()).replace(" ", "-")
+    if slugs is not None:
+        count = slugs.get(slug, 0)
+        slugs[slug] = count + 1
+        if count:
+            slug = f"{slug}-{count}"
+    return slug
+
+
 class Section:
-    name: str
-    sub_sections: List[Section] = field(default_factory=list)
-    parent: Optional[Section] = None
+    # slots instead of a dataclass' __dict__ and no list for the leaves,
+    # trees of a million sections are built for the index of md_toc_index
+    __slots__ = ("name", "sub_sections", "parent", "slug", "offset")
+
+    def __init__(
+        self,
+        name: str,
+        sub_sections: Optional[Sequence[Section]] = None,
+        parent: Optional[Section] = None,
+        slug: Optional[str] = None,
+        offset: Optional[int] = None,
+    ):
+        self.name = name
+        self.sub_sections = () if sub_sections is None else sub_sections
+        self.parent = parent
+        self.slug = slug
+        self.offset = offset  # byte offset of the heading in its file
 
     def __repr__(self):
-        return f"<{self.name}:{self.sub_sections}>"
+        return f"<{self.name}:{list(self.sub_sections)}>"
 
-    def add_subsection(self, name):
-        section = Section(name=name, parent=self)
+    def add_subsection(self, name, slug=None, offset=None):
+        section = Section(name, None, self, slug, offset)
+        if not self.sub_sections:
+            self.sub_sections = []
         self.sub_sections.append(section)
         return section
 
     def get_linked_entry(self):
-        link = self.name.lower().replace(" ", "-")
+        link = self.slug or make_slug(self.name)
         return f"- [{self.name}](#{link})"
 
     def get_unlinked_entry(self):
         return f'- {self.name}'
 
 
-def parse_sections(file, depth=3, heading="# Table of contents:"):
-    sections = []
-    last_section = None
-    last_depth = 1
-    for i, line in enumerate(file):
+class Heading(NamedTuple):
+    offset: int  # byte offset of the first line of the heading
+    end: int  # byte offset of the end of its last line
+    depth: int
+    title: str
+
+
+# the start of a line that could be a heading, a setext underline or a
+# code fence. Searching for a literal newline and one character keeps the
+# regex engine at its fastest, the few candidates are then matched fully.
+# ATX headings, most of the candidates, are matched right away
+_candidate_re = re.compile(
+    rb"\n[ ]{0,3}(?:(\#{1,6})[ \t]([^\n]*)|[#`~=-])"
+)
+_block_re = re.compile(
+    rb"""
+    [ ]{0,3}(?:
+      (?P<atx>\#{1,6})(?:[ \t](?P<atx_title>[^\n]*)|\r?$)
+    | (?P<fence>`{3,}|~{3,})
+    | (?P<underline>=+|-+)[ \t]*\r?$
+    )
+    """,
+    re.MULTILINE | re.VERBOSE
+)
+# the line above an underline, if it is the text of a paragraph
+_setext_title_re = re.compile(
+    rb"""
+    [ ]{0,3}
+    (?![ \t]|\r?$|[-+*][ \t]|\d{1,9}[.)][ \t]|[>|]|\#{1,6}(?:[ \t]|\r?$)
+       |`{3}|~{3}|(?:[-*_][ \t]*){3,}\r?$|=+[ \t]*\r?$)
+    (?P<title>[^\n]*)$
+    """,
+    re.MULTILINE | re.VERBOSE
+)
+_fence_re = re.compile(rb"^[ ]{0,3}(`{3,}|~{3,})", re.MULTILINE)
+_front_matter_re = re.compile(rb"\A---\r?\n.*?^(?:---|\.\.\.)[ \t]*\r?$",
+                              re.MULTILINE | re.DOTALL)
+
+
+def line_number(source, offset, chunk_size=1 << 20):
+    """The number of the line at byte `offset` of `source`, a path, an
+    open file or bytes. Counted only when needed, e.g. for an error, as
+    counting while scanning would cost as much as the scan itself.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return source.count(b"\n", 0, offset) + 1
+    if isinstance(source, str):
+        with open(source, "rb") as file:
+            return line_number(file, offset, chunk_size)
+    file = getattr(source, "buffer", source)
+    file.seek(0)
+    line = 1
+    while offset > 0:
+        chunk = file.read(min(chunk_size, offset))
+        if not chunk:
+            break
+        if isinstance(chunk, str):
+            # scanned encoded, like in `scan_headings`
+            file.seek(0)
+            return line_number(file.read().encode(), offset)
+        line += chunk.count(b"\n")
+        offset -= len(chunk)
+    return line
+
 
-        # if it ain't a heading, skip it
-        if line[0] != "#":
+def scan_headings(source, encoding="utf-8") -> Iterator[Heading]:
+    """Yield the ATX and setext headings of `source`, a path, an open file
+    or bytes, in order. The file is memory mapped and searched with a
+    regex instead of looping over its lines in Python. Headings inside
+    fenced code blocks and YAML front matter are skipped, indented code
+    can't contain any as it is indented by more than three spaces.
+    """
+    with _mapped(source, encoding) as (buffer, encoding):
+        yield from _scan_buffer(buffer, encoding)
+
+
+@contextlib.contextmanager
+def _mapped(source, encoding="utf-8"):
+    # the bytes of `source` and their encoding, memory mapped if possible
+    if isinstance(source, (bytes, bytearray)):
+        yield source, encoding
+        return
+    if isinstance(source, str):
+        with open(source, "rb") as file, _mapped(file, encoding) as mapped:
+            yield mapped
+        return
+    encoding = getattr(source, "encoding", None) or encoding
+    try:
+        buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        # empty files can't be mapped, nor can anything but a real file
+        source.seek(0)
+        text = source.read()
+        if isinstance(text, str):
+            text = text.encode(encoding)
+        yield text, encoding
+        return
+    with buffer:
+        yield buffer, encoding
+
+
+@functools.lru_cache(maxsize=None)
+def _closing_fence_re(fence):
+    return re.compile(
+        rb"\n[ ]{0,3}" + re.escape(fence[:1]) +
+        b"{%d,}[ \t]*\r?$" % len(fence),
+        re.MULTILINE
+    )
+
+
+def _fence_end(buffer, fence, pos):
+    # the end of the code block opened by `fence` up to `pos`, the end of
+    # `buffer` if it isn't closed and None if it is inline code instead
+    info_end = buffer.find(b"\n", pos)
+    if fence[:1] == b"`" and b"`" in buffer[
+        pos:len(buffer) if info_end == -1 else info_end
+    ]:
+        return None
+    closing = _closing_fence_re(fence).search(buffer, pos)
+    return len(buffer) if closing is None else closing.end()
+
+
+def _fenced_blocks(buffer):
+    # the `(start, end)` of the fenced code blocks, in order
+    front_matter = _front_matter_re.match(buffer)
+    pos = 0 if front_matter is None else front_matter.end()
+    while True:
+        match = _fence_re.search(buffer, pos)
+        if match is None:
+            return
+        end = _fence_end(buffer, match.group(1), match.end())
+        if end is None:
+            pos = match.end()
             continue
+        yield match.start(), end
+        pos = end
+
+
+def _candidates(buffer, pos, first_line=False):
+    # the candidates and the newlines before them, None stands in for the
+    # match of the first line, which has no newline before it
+    return itertools.chain(
+        (None,) if first_line else (),
+        _candidate_re.finditer(buffer, pos)
+    )
 
-        if line[:-1] == heading:
-            raise MDToC_Exception(
-                "Found heading that would collide with" +
-                f" the ToC heading on line {i}."
+
+def _atx_title(title):
+    title = title.strip()
+    closed = title.rstrip(b"#")
+    # a closing sequence of hashes is only one after a space
+    if closed != title and (not closed or closed[-1:] in b" \t"):
+        title = closed.rstrip()
+    return title
+
+
+def _scan_buffer(buffer, encoding):
+    front_matter = _front_matter_re.match(buffer)
+    pos = 0 if front_matter is None else front_matter.end()
+    # the start of the last heading, a setext title can't start before it
+    counted = pos
+    # the first line isn't preceded by a newline
+    candidates = _candidates(buffer, pos, pos == 0)
+    while True:
+        for candidate in candidates:
+            if candidate is not None:
+                start = candidate.start() + 1
+                atx, atx_title = candidate.groups()
+                if atx is not None:
+                    counted = start
+                    yield Heading(
+                        start,
+                        candidate.end(),
+                        len(atx),
+                        _atx_title(atx_title).decode(encoding, "replace")
+                    )
+                    continue
+            else:
+                start = 0
+            match = _block_re.match(buffer, start)
+            if match is None:
+                continue
+            atx, atx_title, fence, underline = match.group(
+                "atx", "atx_title", "fence", "underline"
             )
+            if atx is not None:
+                depth = len(atx)
+                title = _atx_title(atx_title or b"")
+            elif fence is not None:
+                end = _fence_end(buffer, fence, match.end())
+                if end is None:
+                    continue
+                if end == len(buffer):
+                    return
+                # search on after the block instead of skipping its candidates
+                counted = end
+                candidates = _candidates(buffer, counted)
+                break
+            else:
+                if start == 0:
+                    continue
+                underline_start = start
+                start = buffer.rfind(b"\n", 0, start - 1) + 1
+                title = _setext_title_re.match(
+                    buffer, start, underline_start - 1
+                )
+                if title is None or start < counted:
+                    continue
+                depth = 1 if underline[:1] == b"=" else 2
+                title = title.group("title")
+            counted = start
+            yield Heading(
+                start,
+                match.end(),
+                depth,
+                title.strip().decode(encoding, "replace")
+            )
+        else:
+            return
 
-        # get the raw caption name
-        raw_caption = line.replace("#", "")
-        # determin the section depth by the difference
-        section_depth = len(line) - len(raw_caption)
-        if section_depth > depth:
-            continue
 
-        # clean up the caption name
-        caption = raw_caption.strip()
-        if section_depth > 1:
-            try:
-                if section_depth - 1 == last_depth:
-                    last_section = last_section.add_subsection(caption)
-                elif section_depth + 1 == last_depth:
-                    last_section = last_section.parent.parent.add_subsection(caption)
-                elif section_depth == last_depth:
-                    last_section = last_section.parent.add_subsection(caption)
-                else:
-                    raise AttributeError()
-            except AttributeError as e:
-                # If this shizzle skedidled something done did fucked up
-                depth_diff = section_depth - last_depth - 1
+@contextlib.contextmanager
+def _gc_paused():
+    # the section tree only grows while it is built, collecting in between
+    # finds nothing but traverses the whole tree again and again
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def parse_sections(
+    file, depth=3, heading="# Table of contents:", linked=True
+):
+    """The tree of the sections of `file` down to `depth`. Their anchors
+    are only made if `linked`, they are what the parsing costs the most.
+    """
+    sections = []
+    # the last section of every depth above the current one
+    parents = []
+    toc_heading = next(scan_headings(heading.encode()), None)
+    # the ToC is usually on top, so its heading gets the plain anchor
+    slugs = {}
+    if toc_heading is not None:
+        make_slug(toc_heading.title, slugs)
+    slug = None
+    with _mapped(file) as (buffer, encoding), _gc_paused():
+        toc = _find_delimited_toc(buffer)
+        for record in _scan_buffer(buffer, encoding):
+            offset, _, level, title = record
+            if toc is not None and toc[0] <= offset < toc[1]:
+                continue
+            if toc_heading is not None and (
+                title == toc_heading.title and level == toc_heading.depth
+            ):
+                # a ToC generated before the delimiters were
+                toc = None if toc else _find_undelimited_toc(buffer, record)
+                if toc is None:
+                    raise MDToC_Exception(
+                        "Found heading that would collide with the ToC " +
+                        f"heading on line {line_number(file, offset)}."
+                    )
+                continue
+            if linked:
+                # deeper headings take anchors too
+                slug = make_slug(title, slugs)
+            if level > depth:
+                continue
+
+            if level > len(parents) + 1:
+                depth_diff = level - len(parents) - 1
                 plural = "s" if depth_diff > 1 else ""
                 raise MDToC_Exception(
-                    f"Found illegal section level at line {i+1},"
+                    "Found illegal section level at line "
+                    f"{line_number(file, offset)}, "
                     f"this section is {depth_diff} level{plural} to deep."
                 )
-        else:
-            last_section = Section(name=caption)
-            sections.append(last_section)
-        last_depth = section_depth
+            del parents[level - 1:]
+            if parents:
+                section = parents[-1].add_subsection(title, slug, offset)
+            else:
+                section = Section(title, None, None, slug, offset)
+                sections.append(section)
+            parents.append(section)
     return sections
 
 
@@ -93,26 +378,297 @@ def generate_toc(sections, linked=False):
     return toc
 
 
+def copy_replacing(source, target, old, new, chunk_size=1 << 20):
+    """Copy `source` to `target` chunk by chunk, replacing every `old`
+    with `new`. Returns the number of replacements.
+    """
+    count = 0
+    pending = ""
+    for chunk in iter(lambda: source.read(chunk_size), ""):
+        text = pending + chunk
+        pos = 0
+        while True:
+            i = text.find(old, pos)
+            if i == -1:
+                break
+            target.write(text[pos:i])
+            target.write(new)
+            pos = i + len(old)
+            count += 1
+        # the end could be the start of the next `old`
+        keep = max(pos, len(text) - len(old) + 1)
+        target.write(text[pos:keep])
+        pending = text[keep:]
+    target.write(pending)
+    return count
+
+
+TOC_START = "<!-- md_toc -->"
+TOC_END = "<!-- /md_toc -->"
+_toc_start_re = re.compile(re.escape(TOC_START.encode()) + rb"[ \t]*\r?\n")
+_toc_end_re = re.compile(
+    rb"^" + re.escape(TOC_END.encode()) + rb"[ \t]*(?:\r?\n|\Z)",
+    re.MULTILINE
+)
+# the entries below the heading of a ToC without delimiters
+_toc_entries_re = re.compile(rb"\r?\n(?:[ \t]*- [^\n]*\n)+")
+
+
+def toc_block(toc, heading="# Table of contents:"):
+    """The text `inject_toc` puts into a file for `toc`."""
+    return (
+        f"{TOC_START}\n{heading}\n" +
+        "".join(f"{entry}\n" for entry in toc) +
+        f"\n{TOC_END}\n"
+    )
+
+
+def _find_delimited_toc(buffer):
+    # a plain find for the start delimiter is faster than any regex.
+    # Delimiters in fenced code, e.g. documenting them, don't count, the
+    # blocks are only looked for once a delimiter is found and up to it
+    blocks = _fenced_blocks(buffer)
+    block = (-1, -1)
+
+    def in_code(pos):
+        nonlocal block
+        while block[1] <= pos:
+            block = next(blocks, (len(buffer) + 1, len(buffer) + 1))
+        return block[0] <= pos
+
+    start = 0
+    while True:
+        match = _toc_start_re.match(buffer, start)
+        if match is not None and not in_code(start):
+            end = _toc_end_re.search(buffer, match.end())
+            while end is not None and in_code(end.start()):
+                end = _toc_end_re.search(buffer, end.end())
+            return None if end is None else (start, end.end())
+        start = buffer.find(b"\n" + TOC_START.encode(), start) + 1
+        if not start:
+            return None
+
+
+def _find_undelimited_toc(buffer, record):
+    match = _toc_entries_re.match(buffer, record.end)
+    if match is None:
+        return None
+    return record.offset, match.end()
+
+
+def find_toc(source, heading="# Table of contents:", encoding="utf-8"):
+    """The byte range of the ToC `inject_toc` put into `source` before,
+    between delimiters or, if there are none, below `heading`. None if
+    there is no ToC.
+    """
+    with _mapped(source, encoding) as (buffer, encoding):
+        toc = _find_delimited_toc(buffer)
+        if toc is not None:
+            return toc
+        toc_heading = next(scan_headings(heading.encode()), None)
+        if toc_heading is None:
+            return None
+        for record in _scan_buffer(buffer, encoding):
+            if (record.depth, record.title) == (
+                toc_heading.depth, toc_heading.title
+            ):
+                toc = _find_undelimited_toc(buffer, record)
+                if toc is not None:
+                    return toc
+    return None
+
+
+def _copy_range(buffer, target, start, end, chunk_size=1 << 20):
+    for i in range(start, end, chunk_size):
+        target.write(buffer[i:min(i + chunk_size, end)])
+
+
 def inject_toc(file, toc, marker=None, heading="# Table of contents:"):
-    file.seek(0)
-    text = file.read()
-    toc_string = heading + "\n" + "\n".join(toc) + "\n\n"
-    if marker:
-        if marker in text:
-            new_text = re.sub(marker + "\n", toc_string, text)
-        else:
-            raise MDToC_Exception("Couldn't find the given marker.")
-    else:
-        new_text = toc_string + text
+    """Put `toc` into `file`, replacing the ToC found by `find_toc`, else
+    at the `marker` line, else on top. Returns False, without writing, if
+    the ToC is the same already.
+
+    The file is streamed into a temporary file that then replaces it, so
+    memory use doesn't depend on its size and readers never see a partial
+    one.
+    """
+    block = toc_block(toc, heading)
+    path = os.path.abspath(file.name)
+    encoding = getattr(file, "encoding", None) or "utf-8"
+    with _mapped(path, encoding) as (buffer, _):
+        toc_range = find_toc(buffer, heading, encoding)
+        if toc_range is not None:
+            start, end = toc_range
+            if buffer[start:end] == block.encode(encoding):
+                return False
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix=".tmp-", suffix=".md"
+        )
+        try:
+            if toc_range is not None:
+                # only the range of the old ToC changes, bytes are copied
+                with os.fdopen(fd, "wb") as tmp:
+                    _copy_range(buffer, tmp, 0, start)
+                    tmp.write(block.encode(encoding))
+                    _copy_range(buffer, tmp, end, len(buffer))
+            else:
+                file.seek(0)
+                with os.fdopen(fd, "w", encoding=encoding) as tmp:
+                    # the blank line stays when the block is replaced
+                    if not marker:
+                        tmp.write(block + "\n")
+                        shutil.copyfileobj(file, tmp, 1 << 20)
+                    elif not copy_replacing(
+                        file, tmp, marker + "\n", block + "\n"
+                    ):
+                        raise MDToC_Exception("Couldn't find the given marker.")
+            shutil.copymode(path, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return True
+
+
+def toc_digest(toc, marker=None, heading="# Table of contents:"):
+    """Digest of what `inject_toc` would write, to tell if it changed."""
+    return hashlib.sha256(
+        json.dumps([toc, marker, heading]).encode()
+    ).hexdigest()
+
+
+def file_state(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def update_file(path, depth=3, linked=False, marker=None,
+                heading="# Table of contents:", entry=None):
+    """Inject the ToC into the file at `path`, unless its manifest `entry`
+    shows that the file didn't change since the last time, or the file
+    already holds the same ToC. Returns `(path, status, entry)`, status is "rewritten", "unchanged"
+    or the error, for which the entry is None.
+    """
+    try:
+        state = file_state(path)
+        content = file_digest(path)
+        if entry is not None and entry["content"] == content:
+            return path, "unchanged", dict(entry, state=state)
+        with open(path) as file:
+            toc = generate_toc(
+                parse_sections(file, depth, heading, linked), linked
+            )
+            digest = toc_digest(toc, marker, heading)
+            rewritten = inject_toc(file, toc, marker, heading)
+        if rewritten:
+            state = file_state(path)
+            content = file_digest(path)
+    except (MDToC_Exception, OSError, UnicodeDecodeError) as e:
+        return path, f"failed: {e}", None
+    return path, "rewritten" if rewritten else "unchanged", dict(
+        entry or {}, state=state, content=content, toc=digest
+    )
+
+
+def _update_file(args):
+    return update_file(*args)
 
-    file.seek(0)
-    file.write(new_text)
+
+def find_files(source):
+    """The markdown files below the directory `source`, or matching the
+    glob pattern `source`.
+    """
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(source)
+            for name in names
+            if name.endswith(".md")
+        )
+    return sorted(
+        path for path in glob.glob(source, recursive=True)
+        if os.path.isfile(path)
+    )
+
+
+def update_files(paths, depth=3, linked=False, marker=None,
+                 heading="# Table of contents:", manifest=None, jobs=None,
+                 verbose=False):
+    """Inject ToCs into many files on a process pool and return a summary.
+
+    `manifest` is the path of a JSON file remembering the state, content
+    digest and ToC digest of every file. Files that weren't modified since
+    are skipped without reading them, files with the same content or ToC
+    aren't written.
+    """
+    start = time.perf_counter()
+    known = {}
+    if manifest and os.path.exists(manifest):
+        with open(manifest) as f:
+            known = json.load(f)
+
+    options = toc_digest([depth, linked], marker, heading)
+    tasks = []
+    for path in paths:
+        path = os.path.abspath(path)
+        entry = known.get(path)
+        if entry is not None and entry["options"] != options:
+            entry = None
+        if entry is not None:
+            try:
+                if entry["state"] == file_state(path):
+                    continue
+            except OSError:
+                pass
+        tasks.append((path, depth, linked, marker, heading, entry))
+
+    summary = {"files": len(paths), "scanned": len(tasks), "rewritten": 0,
+               "failed": 0}
+    jobs = min(jobs or os.cpu_count() or 1, len(tasks))
+    if tasks:
+        with mp.Pool(jobs) as pool:
+            for path, status, entry in pool.imap_unordered(
+                _update_file,
+                tasks,
+                chunksize=max(1, len(tasks) // (jobs * 4))
+            ):
+                if verbose:
+                    print(f"{path}: {status}")
+                if entry is None:
+                    summary["failed"] += 1
+                    known.pop(path, None)
+                    continue
+                if status == "rewritten":
+                    summary["rewritten"] += 1
+                entry["options"] = options
+                known[path] = entry
+    summary["skipped"] = (
+        summary["files"] - summary["rewritten"] - summary["failed"]
+    )
+
+    if manifest:
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(manifest)), prefix=".tmp-"
+        )
+        with os.fdopen(fd, "w") as f:
+            json.dump(known, f)
+        os.replace(tmp_path, manifest)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
 
 
 def main(infile, depth, linked, marker, outfile, verbose, heading):
     if verbose:
         print("Gather sections...", end="")
-    sections = parse_sections(infile, depth, heading)
+    sections = parse_sections(infile, depth, heading, linked)
     if verbose:
         print("done")
         print("Generating ToC from sections...", end="")
@@ -120,9 +676,9 @@ def main(infile, depth, linked, marker, outfile, verbose, heading):
     if verbose:
         print("done")
         print("Injecting ToC into file...", end="")
-    inject_toc(outfile or infile, toc, marker, heading)
+    rewritten = inject_toc(outfile or infile, toc, marker, heading)
     if verbose:
-        print("done")
+        print("done" if rewritten else "unchanged")
 
 
 if __name__ == "__main__":
@@ -136,12 +692,19 @@ if __name__ == "__main__":
             print("The given depth must be > 0.")
             exit()
 
+    def source(s):
+        # directories and glob patterns are expanded by `find_files`
+        if os.path.isdir(s) or any(c in s for c in "*?["):
+            return s
+        return argparse.FileType("r")(s)
+
     parser = argparse.ArgumentParser(description="Inject ToC into md-file")
     parser.add_argument(
         "source",
         metavar="S",
-        type=argparse.FileType("r+"),
-        help="the file to source from",
+        type=source,
+        help="the file to source from, or a directory or glob pattern "
+        "of files to update",
     )
     parser.add_argument(
         "-l", "--linked", action="store_true", help="make ToC entries linked"
@@ -177,11 +740,52 @@ if __name__ == "__main__":
         "-o",
         "--output",
         metavar="O",
-        type=argparse.FileType("r+"),
+        type=argparse.FileType("r"),
         default=None,
         help="the location to add the ToC",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="J",
+        type=gt_zero,
+        default=None,
+        help="number of processes for a directory, defaults to the CPUs",
+    )
+    parser.add_argument(
+        "-M",
+        "--manifest",
+        metavar="M",
+        type=str,
+        default=".md_toc_manifest.json",
+        help="file remembering the ToCs, relative to a directory S, '' "
+        "for none",
+    )
     args = parser.parse_args()
+    if isinstance(args.source, str):
+        if args.output:
+            parser.error("a directory or pattern is updated in place")
+        try:
+            summary = update_files(
+                find_files(args.source),
+                args.depth,
+                args.linked,
+                args.marker,
+                args.heading,
+                os.path.join(args.source, args.manifest)
+                if args.manifest and os.path.isdir(args.source) else
+                args.manifest,
+                args.jobs,
+                args.verbose,
+            )
+        except KeyboardInterrupt:
+            exit(1)
+        print(
+            f"{summary['files']} files: {summary['scanned']} scanned, "
+            f"{summary['rewritten']} rewritten, {summary['skipped']} skipped, "
+            f"{summary['failed']} failed in {summary['seconds']:.2f}s"
+        )
+        exit(1 if summary["failed"] else 0)
     try:
         main(
             args.source,
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+import os
+import random
+import sys
+import tempfile
+import time
+
+import md_toc
+
+
+def make_markdown(path, size, code=0.3, seed=0):
+    """Write about `size` bytes of markdown with nested headings,
+    paragraphs and, in a `code` fraction of the sections, fenced code full
+    of "#" comments to `path`.
+    """
+    rng = random.Random(seed)
+    written = 0
+    depth = 0
+    with open(path, "w") as f:
+        while written < size:
+            depth = rng.randint(1, min(3, depth + 1))
+            parts = [f"{'#' * depth} Heading {written}\n"]
+            parts += [
+                "Some text of a paragraph, long enough to be a line.\n"
+                for _ in range(rng.randint(1, 20))
+            ]
+            if rng.random() < code:
+                parts.append("```python\n")
+                parts += [
+                    f"# comment {i}\nx = {i}\n" for i in range(rng.randint(1, 10))
+                ]
+                parts.append("```\n")
+            block = "".join(parts) + "\n"
+            f.write(block)
+            written += len(block)
+
+
+def line_parse_sections(file, depth=3, heading="# Table of contents:"):
+    """The line by line `parse_sections` that `scan_headings` replaced,
+    code blocks and setext headings not considered and no anchors made.
+    """
+    sections = []
+    last_section = None
+    last_depth = 1
+    for i, line in enumerate(file):
+        if line[0] != "#":
+            continue
+        if line[:-1] == heading:
+            raise md_toc.MDToC_Exception(
+                "Found heading that would collide with" +
+                f" the ToC heading on line {i}."
+            )
+        raw_caption = line.replace("#", "")
+        section_depth = len(line) - len(raw_caption)
+        if section_depth > depth:
+            continue
+        caption = raw_caption.strip()
+        if section_depth > 1:
+            if section_depth - 1 == last_depth:
+                last_section = last_section.add_subsection(caption)
+            elif section_depth + 1 == last_depth:
+                last_section = last_section.parent.parent.add_subsection(
+                    caption
+                )
+            elif section_depth == last_depth:
+                last_section = last_section.parent.add_subsection(caption)
+            else:
+                raise md_toc.MDToC_Exception(
+                    f"Found illegal section level at line {i + 1}."
+                )
+        else:
+            last_section = md_toc.Section(name=caption)
+            sections.append(last_section)
+        last_depth = section_depth
+    return sections
+
+
+def timed(func, path, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        with open(path) as file:
+            start = time.perf_counter()
+            func(file)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the heading scanner of md_toc against "
+        "its line by line parser."
+    )
+    parser.add_argument(
+        "-s",
+        "--size",
+        metavar="S",
+        type=int,
+        nargs="+",
+        default=[16, 256],
+        help="sizes of the generated files in MiB",
+    )
+    parser.add_argument(
+        "-c",
+        "--code",
+        metavar="C",
+        type=float,
+        default=0.3,
+        help="fraction of the sections with a code block, the line by "
+        "line parser takes the comments in them for headings"
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        metavar="R",
+        type=int,
+        default=3,
+        help="number of runs per file, the best one counts",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.size:
+            path = os.path.join(directory, f"{size}.md")
+            make_markdown(path, size * 1024 * 1024, args.code)
+            try:
+                baseline = timed(line_parse_sections, path, args.repeat)
+            except md_toc.MDToC_Exception as e:
+                # a "#" comment taken for a heading broke its nesting
+                print(f"{size: >6} MiB {'line by line': <15} failed: {e}",
+                      file=sys.stderr)
+                baseline = None
+            results = {
+                "scan_headings": timed(
+                    lambda f: sum(1 for _ in md_toc.scan_headings(f)),
+                    path,
+                    args.repeat
+                ),
+                "parse_sections": timed(
+                    lambda f: md_toc.parse_sections(f, linked=False),
+                    path,
+                    args.repeat
+                ),
+                "  linked": timed(md_toc.parse_sections, path, args.repeat),
+            }
+            if baseline is not None:
+                results = {"line by line": baseline, **results}
+            for name, seconds in results.items():
+                print(
+                    f"{size: >6} MiB {name: <15} {seconds: >8.3f}s "
+                    f"{size / seconds: >8.1f} MiB/s" + (
+                        "" if baseline is None else
+                        f" x{baseline / seconds:.2f}"
+                    ),
+                    file=sys.stderr
+                )
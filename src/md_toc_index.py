@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+import bisect
+import json
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+from typing import Iterator, List, NamedTuple
+
+import md_toc
+
+
+class Entry(NamedTuple):
+    file: str  # relative to the directory of the index
+    offset: int  # byte offset of the heading in the file
+    depth: int
+    slug: str
+    title: str
+
+
+def headings(path, depth=6, heading="# Table of contents:"):
+    """The `(offset, depth, slug, title)` rows of the headings of the file
+    at `path` down to `depth`, in the order of the document. Unlike
+    `md_toc.parse_sections` this rejects nothing: a heading more than one
+    level below the one before it is nested right below it. The ToC
+    `md_toc` put into the file is left out.
+    """
+    records = list(md_toc.scan_headings(path))
+    toc_heading = next(md_toc.scan_headings(heading.encode()), None)
+    toc = None
+    if toc_heading is not None and any(
+        record.title == toc_heading.title and
+        record.depth == toc_heading.depth
+        for record in records
+    ):
+        toc = md_toc.find_toc(path, heading)
+    slugs = {}
+    # the levels of the headings the current one is nested in
+    levels = []
+    for record in records:
+        # the ToC heading takes an anchor too
+        slug = md_toc.make_slug(record.title, slugs)
+        if toc is not None and toc[0] <= record.offset < toc[1]:
+            continue
+        if record.depth > depth:
+            continue
+        while levels and levels[-1] >= record.depth:
+            levels.pop()
+        levels.append(record.depth)
+        yield record.offset, len(levels), slug, record.title
+
+
+def extract(path, depth=6, digest=None):
+    """Scan the headings of the markdown file at `path`, unless its
+    content digest is still `digest`. Returns `(path, status, state,
+    digest, rows)`, status is "indexed", "unchanged" or the error, rows are
+    None unless indexed.
+    """
+    try:
+        state = md_toc.file_state(path)
+        content = md_toc.file_digest(path)
+        if content == digest:
+            return path, "unchanged", state, content, None
+        rows = list(headings(path, depth))
+    except OSError as e:
+        return path, f"failed: {e}", None, None, None
+    return path, "indexed", state, content, rows
+
+
+def _extract(args):
+    return extract(*args)
+
+
+class HeadingIndex:
+    """The headings of many markdown files, kept in a JSON file as
+    `{file: [state, digest, rows]}`, see `headings` for the rows.
+    """
+
+    version = 1
+
+    __slots__ = ("path", "depth", "files", "_search")
+
+    def __init__(self, path=None, depth=6):
+        self.path = path
+        self.depth = depth
+        self.files = {}
+        # built on the first search, see `_searchable`
+        self._search = None
+
+    @property
+    def base(self):
+        return os.path.dirname(os.path.abspath(self.path or "."))
+
+    @classmethod
+    def load(cls, path, depth=6):
+        index = cls(path, depth)
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            # an index of another depth is rebuilt
+            if data.get("version") == cls.version and data["depth"] == depth:
+                index.files = data["files"]
+        return index
+
+    def save(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.base, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(
+                {
+                    "version": self.version,
+                    "depth": self.depth,
+                    "files": self.files,
+                },
+                f,
+                separators=(",", ":"),
+            )
+        os.replace(tmp_path, self.path)
+
+    def update(self, paths, jobs=None, verbose=False):
+        """Index the files at `paths` on a process pool and return a
+        summary. Files whose state didn't change since are skipped without
+        reading them, those whose content didn't change aren't parsed.
+        Files no longer among `paths` are dropped.
+        """
+        start = time.perf_counter()
+        base = self.base
+        files = {}
+        tasks = []
+        for path in paths:
+            path = os.path.abspath(path)
+            entry = self.files.get(os.path.relpath(path, base))
+            if entry is not None:
+                try:
+                    if entry[0] == md_toc.file_state(path):
+                        files[os.path.relpath(path, base)] = entry
+                        continue
+                except OSError:
+                    pass
+            tasks.append((path, self.depth, entry and entry[1]))
+
+        summary = {"files": len(paths), "scanned": len(tasks), "indexed": 0,
+                   "failed": 0}
+        jobs = min(jobs or os.cpu_count() or 1, len(tasks))
+        if tasks:
+            with mp.Pool(jobs) as pool:
+                for path, status, state, digest, rows in pool.imap_unordered(
+                    _extract,
+                    tasks,
+                    chunksize=max(1, len(tasks) // (jobs * 4))
+                ):
+                    if verbose:
+                        print(f"{path}: {status}", file=sys.stderr)
+                    name = os.path.relpath(path, base)
+                    if state is None:
+                        summary["failed"] += 1
+                        continue
+                    if rows is None:
+                        rows = self.files[name][2]
+                    else:
+                        summary["indexed"] += 1
+                    files[name] = [state, digest, rows]
+        summary["removed"] = len(self.files.keys() - files.keys())
+        summary["headings"] = sum(len(entry[2]) for entry in files.values())
+        self.files = files
+        self._search = None
+        summary["seconds"] = time.perf_counter() - start
+        return summary
+
+    def entries(self, files=None) -> Iterator[Entry]:
+        for name in sorted(self.files if files is None else files):
+            for row in self.files[name][2]:
+                yield Entry(name, *row)
+
+    def _searchable(self):
+        # all titles lowercased in one string, so a substring is found by
+        # `str.find` instead of a loop over the headings, and sorted for
+        # a prefix to be found by bisection
+        if self._search is None:
+            entries = list(self.entries())
+            titles = [entry.title.lower() for entry in entries]
+            starts = []
+            pos = 0
+            for title in titles:
+                starts.append(pos)
+                pos += len(title) + 1
+            order = sorted(range(len(titles)), key=titles.__getitem__)
+            self._search = (
+                entries,
+                "\n".join(titles),
+                starts,
+                [titles[i] for i in order],
+                order,
+            )
+        return self._search
+
+    def search(self, text, prefix=False) -> List[Entry]:
+        """The headings whose title contains `text`, or starts with it,
+        ignoring case, in the order of the files.
+        """
+        entries, titles, starts, keys, order = self._searchable()
+        text = text.lower()
+        if not text:
+            return list(entries)
+        if "\n" in text:
+            # the separator of the titles, it's in none of them
+            return []
+        if prefix:
+            first = bisect.bisect_left(keys, text)
+            last = first
+            while last < len(keys) and keys[last].startswith(text):
+                last += 1
+            return [entries[i] for i in sorted(order[first:last])]
+        found = []
+        pos = titles.find(text)
+        while pos != -1:
+            i = bisect.bisect_right(starts, pos) - 1
+            found.append(entries[i])
+            # on with the next title
+            pos = titles.find(
+                text, starts[i + 1] if i + 1 < len(starts) else len(titles)
+            )
+        return found
+
+    def toc(self, linked=False, files=None) -> List[str]:
+        """One ToC over `files` or all indexed ones, each file an entry
+        with its headings below it, linked relative to the index.
+        """
+        toc = []
+        current = None
+        for entry in self.entries(files):
+            link = entry.file.replace(os.sep, "/")
+            if entry.file != current:
+                current = entry.file
+                toc.append(f"- [{entry.file}]({link})" if linked else
+                           f"- {entry.file}")
+            toc.append(
+                " " * entry.depth + (
+                    f"- [{entry.title}]({link}#{entry.slug})"
+                    if linked else
+                    f"- {entry.title}"
+                )
+            )
+        return toc
+
+
+if __name__ == "__main__":
+    import argparse
+
+    def positive_int(val):
+        try:
+            i = int(val)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(e.args[0])
+        if i <= 0:
+            raise argparse.ArgumentTypeError(f"{i} <= 0")
+        return i
+
+    parser = argparse.ArgumentParser(
+        description="Index the headings of many md-files, "
+        "search them and make one ToC of them."
+    )
+    parser.add_argument(
+        "sources",
+        metavar="S",
+        type=str,
+        nargs="*",
+        help="files, directories or glob patterns of the files to index, "
+        "the index is only updated if given",
+    )
+    parser.add_argument(
+        "-i",
+        "--index",
+        metavar="I",
+        type=str,
+        default=".md_toc_index.json",
+        help="the index file, its directory is the root of the paths in it",
+    )
+    parser.add_argument(
+        "-d",
+        "--depth",
+        metavar="D",
+        type=positive_int,
+        default=6,
+        help="the depth of the indexed headings",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="J",
+        type=positive_int,
+        default=None,
+        help="number of processes, defaults to the CPUs",
+    )
+    parser.add_argument(
+        "-s",
+        "--search",
+        metavar="Q",
+        type=str,
+        default=None,
+        help="print the headings containing Q, ignoring case",
+    )
+    parser.add_argument(
+        "-p",
+        "--prefix",
+        action="store_true",
+        help="search for the headings starting with Q instead",
+    )
+    parser.add_argument(
+        "-t",
+        "--toc",
+        action="store_true",
+        help="print a ToC of all indexed files",
+    )
+    parser.add_argument(
+        "-l", "--linked", action="store_true", help="make ToC entries linked"
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="display processing state"
+    )
+    args = parser.parse_args()
+    if args.prefix and args.search is None:
+        parser.error("-p/--prefix needs -s/--search")
+
+    index = HeadingIndex.load(args.index, args.depth)
+    if args.sources:
+        paths = sorted({
+            path
+            for source in args.sources
+            for path in md_toc.find_files(source)
+        })
+        try:
+            summary = index.update(paths, args.jobs, args.verbose)
+        except KeyboardInterrupt:
+            exit(1)
+        index.save()
+        print(
+            f"{summary['files']} files: {summary['scanned']} scanned, "
+            f"{summary['indexed']} indexed, {summary['failed']} failed, "
+            f"{summary['removed']} removed, {summary['headings']} headings "
+            f"in {summary['seconds']:.2f}s",
+            file=sys.stderr
+        )
+    if args.search is not None:
+        for entry in index.search(args.search, args.prefix):
+            print(
+                f"{entry.file}#{entry.slug}\t{'#' * entry.depth} {entry.title}"
+            )
+    if args.toc:
+        print("\n".join(index.toc(args.linked)))
+    if args.sources and summary["failed"]:
+        exit(1)